@@ -0,0 +1,238 @@
+"""Measure the throughput of reddit_alert keyword matching offline.
+
+The benchmark feeds a synthetic comment corpus, or one recorded with
+``reddit_alert --record FILE``, through the same matching pipeline that
+reddit_alert uses on the live comment stream and reports, for each combination
+of keyword count and comment body length:
+
+* the time taken to compile the keywords
+* the comments matched per second
+* the 50th and 99th percentile time taken to match a single comment
+
+It exits with status 1 when a 99th percentile latency exceeds its limit, so
+that it can guard against regressions.
+
+"""
+
+from __future__ import print_function
+
+import random
+import sys
+import time
+from optparse import OptionParser
+
+from prawtools.alert import (
+    Matcher,
+    MiniComment,
+    match_items,
+    matcher_pool,
+    read_corpus,
+)
+from prawtools.fake import WORDS
+
+BODIES = {  # The number of words in a comment body
+    "long": lambda rng: rng.randint(200, 2000),
+    "short": lambda rng: int(rng.expovariate(1 / 8.0)) + 1,
+    "typical": lambda rng: int(rng.lognormvariate(3.4, 1.0)) + 1,
+}
+USERS = 100000  # The number of distinct comment authors
+
+
+def keywords(count, seed):
+    """Return `count` distinct keywords that never occur in WORDS.
+
+    One in ten keywords is a two word phrase.
+
+    """
+    rng = random.Random("keywords/{}".format(seed))
+    result = set()
+    while len(result) < count:
+        words = [
+            "".join(
+                rng.choice("bcdfghjklmnpqrstvwxz") for _ in range(rng.randint(4, 9))
+            )
+            for _ in range(2 if rng.random() < 0.1 else 1)
+        ]
+        result.add(" ".join(words))
+    return sorted(result)
+
+
+def percentile(values, fraction):
+    """Return the value at `fraction` of the sorted `values`."""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(matcher, corpus, processes=1, batch_size=1):
+    """Match each comment of the corpus.
+
+    :returns: A tuple (comments per second, matches, sorted latencies).
+
+    """
+    pool = matcher_pool(processes, matcher) if processes > 1 else None
+    try:
+        start = time.time()
+        results = list(match_items(corpus, lambda: matcher, pool, batch_size))
+        seconds = time.time() - start
+    finally:
+        if pool:
+            pool.terminate()
+    latencies = sorted(result.seconds for result in results)
+    matches = sum(1 for result in results if result.keyword)
+    return len(results) / seconds, matches, latencies
+
+
+def synthetic_corpus(count, body, keywords, match_rate, seed):
+    """Return a list of `count` MiniComments.
+
+    :param body: The name of the body length distribution in BODIES.
+    :param keywords: The keywords to mention in matching comments.
+    :param match_rate: The fraction of comments mentioning a keyword.
+
+    """
+    rng = random.Random("corpus/{}/{}".format(body, seed))
+    corpus = []
+    for number in range(count):
+        words = [rng.choice(WORDS) for _ in range(BODIES[body](rng))]
+        if rng.random() < match_rate:
+            words.insert(rng.randint(0, len(words)), rng.choice(keywords))
+        corpus.append(
+            MiniComment(
+                "user{}".format(rng.randint(0, USERS - 1)),
+                " ".join(words).capitalize() + ".",
+                1466000000 + number,
+                "c{}".format(number),
+                "t3_s{}".format(number // 100),
+                "benchmark",
+            )
+        )
+    return corpus
+
+
+def main():
+    """Run the benchmark."""
+    parser = OptionParser(usage="Usage: %prog [options]")
+    parser.add_option(
+        "--batch-size",
+        type="int",
+        default=1,
+        help="The number of comments handed to a process at once [default: %default].",
+    )
+    parser.add_option(
+        "--bodies",
+        default="short,typical,long",
+        help=(
+            "The comma separated body length distributions: short averages 8 "
+            "words, typical 50 words with a long tail, and long 200 to 2000 "
+            "words [default: %default]."
+        ),
+    )
+    parser.add_option(
+        "--comments",
+        type="int",
+        default=10000,
+        help="The number of synthetic comments per run [default: %default].",
+    )
+    parser.add_option(
+        "--corpus",
+        metavar="FILE",
+        help="Replay the comments recorded by `reddit_alert --record FILE`.",
+    )
+    parser.add_option(
+        "--ignore-users",
+        type="int",
+        default=1000,
+        help="The number of ignored users [default: %default].",
+    )
+    parser.add_option(
+        "--keywords",
+        default="10,100,1000,10000,100000",
+        help="The comma separated keyword counts [default: %default].",
+    )
+    parser.add_option(
+        "--match-rate",
+        type="float",
+        default=0.01,
+        help=(
+            "The fraction of synthetic comments mentioning a keyword "
+            "[default: %default]."
+        ),
+    )
+    parser.add_option(
+        "--max-p99",
+        type="float",
+        metavar="MILLISECONDS",
+        help="The limit of the 99th percentile latency of every run.",
+    )
+    parser.add_option(
+        "-P",
+        "--processes",
+        type="int",
+        default=1,
+        help="The number of processes used to match comments [default: %default].",
+    )
+    parser.add_option(
+        "--seed",
+        default="0",
+        help="The seed used to generate keywords and comments [default: %default].",
+    )
+    options, _ = parser.parse_args()
+
+    counts = [int(x) for x in options.keywords.split(",")]
+    if options.corpus:
+        bodies = ["recorded"]
+        recorded = list(read_corpus(options.corpus))
+    else:
+        bodies = options.bodies.split(",")
+        unknown = set(bodies) - set(BODIES)
+        if unknown:
+            parser.error("Unknown bodies: {}".format(", ".join(sorted(unknown))))
+    ignore_users = ["user{}".format(x) for x in range(options.ignore_users)]
+
+    print(
+        "{:>8} {:>8} {:>10} {:>12} {:>8} {:>10} {:>10}".format(
+            "keywords",
+            "bodies",
+            "compile s",
+            "comments/s",
+            "matches",
+            "p50 ms",
+            "p99 ms",
+        )
+    )
+    failed = False
+    for count in counts:
+        words = keywords(count, options.seed)
+        start = time.time()
+        matcher = Matcher(words, ignore_users)
+        compile_seconds = time.time() - start
+        for body in bodies:
+            if options.corpus:
+                corpus = recorded
+            else:
+                corpus = synthetic_corpus(
+                    options.comments, body, words, options.match_rate, options.seed
+                )
+            rate, matches, latencies = run(
+                matcher, corpus, options.processes, options.batch_size
+            )
+            p99 = percentile(latencies, 0.99) * 1000
+            exceeded = options.max_p99 is not None and p99 > options.max_p99
+            failed = failed or exceeded
+            print(
+                "{:>8} {:>8} {:>10.2f} {:>12.0f} {:>8} {:>10.3f} {:>10.3f}{}".format(
+                    count,
+                    body,
+                    compile_seconds,
+                    rate,
+                    matches,
+                    percentile(latencies, 0.5) * 1000,
+                    p99,
+                    " (limit {} exceeded)".format(options.max_p99) if exceeded else "",
+                )
+            )
+            sys.stdout.flush()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""Measure the memory footprint of subreddit_stats on synthetic data.
+
+The benchmark processes the comments of synthetic submissions generated by
+:class:`prawtools.fake.FakeReddit` through real praw objects, without any
+network access, and reports:
+
+* the bytes allocated per MiniComment and per MiniSubmission
+* the memory retained per stored comment and the peak memory of the run
+* the run time with and without a full garbage collection after every
+  submission, which subreddit_stats used to perform
+
+It exits with status 1 when a measurement exceeds its limit, so that it can
+guard against regressions.
+
+"""
+
+from __future__ import print_function
+
+import gc
+import sys
+import time
+import tracemalloc
+from optparse import OptionParser
+
+from prawtools.fake import FakeReddit, offline_reddit
+from prawtools.stats import MiniComment, MiniSubmission, SubredditStats
+
+SAMPLES = 10000  # The number of objects created to measure their size
+
+
+class Item(object):
+    """A stand-in for the praw Comment or Submission a Mini object copies."""
+
+    def __init__(self, **attributes):
+        """Initialize the Item with `attributes`."""
+        self.__dict__.update(attributes)
+
+
+def bytes_per_object(factory):
+    """Return the average number of bytes allocated by calling `factory`."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory() for _ in range(SAMPLES)]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del objects
+    return allocated / float(SAMPLES)
+
+
+def stats_run(submissions, comments, collect=False, trace=True):
+    """Process the comments of a synthetic subreddit.
+
+    :param collect: Perform a full garbage collection after every submission.
+    :param trace: Measure memory, which slows the run down.
+    :returns: A tuple (comments, seconds, retained, peak) where retained and
+        peak are in bytes.
+
+    """
+    fake = FakeReddit(
+        submissions, comments, visible=sys.maxsize, users=100000, interval=60
+    )
+    reddit = offline_reddit(fake)
+    if collect:
+        submission = reddit.submission
+
+        def collecting_submission(*args, **kwargs):
+            gc.collect()
+            return submission(*args, **kwargs)
+
+        reddit.submission = collecting_submission
+    stats = SubredditStats("benchmark", None, True, "benchmark", reddit=reddit)
+    stats.fetch_top_submissions("all")
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    start = time.time()
+    stats.process_commenters()
+    seconds = time.time() - start
+    retained, peak = tracemalloc.get_traced_memory() if trace else (0, 0)
+    tracemalloc.stop()
+    return len(stats.comments), seconds, retained, peak
+
+
+def main():
+    """Run the benchmark."""
+    parser = OptionParser(usage="Usage: %prog [options]")
+    parser.add_option(
+        "--submissions",
+        type="int",
+        default=1000,
+        help="The number of submissions [default: %default].",
+    )
+    parser.add_option(
+        "--comments",
+        type="int",
+        default=1000,
+        help="The average number of comments per submission [default: %default].",
+    )
+    parser.add_option(
+        "--max-comment-bytes",
+        type="float",
+        default=100,
+        help="The limit of bytes per MiniComment [default: %default].",
+    )
+    parser.add_option(
+        "--max-submission-bytes",
+        type="float",
+        default=140,
+        help="The limit of bytes per MiniSubmission [default: %default].",
+    )
+    parser.add_option(
+        "--max-peak-bytes",
+        type="float",
+        default=350,
+        help=(
+            "The limit of peak bytes per stored comment. Smaller runs need a "
+            "higher limit as a larger share of their peak is fixed overhead "
+            "[default: %default]."
+        ),
+    )
+    parser.add_option(
+        "--skip-gc",
+        action="store_true",
+        help="Skip comparing the run time with per-submission garbage collection.",
+    )
+    options, _ = parser.parse_args()
+
+    submission = Item(
+        author="author",
+        created_utc=1.0,
+        distinguished=None,
+        id="id",
+        num_comments=1,
+        permalink="/r/benchmark/comments/id/",
+        score=1,
+        title="title",
+        url="https://www.reddit.com/r/benchmark/comments/id/",
+    )
+    comment = Item(author="author", created_utc=1.0, id="id", score=1)
+    comment_bytes = bytes_per_object(lambda: MiniComment(comment, submission))
+    submission_bytes = bytes_per_object(lambda: MiniSubmission(submission))
+    count, seconds, retained, peak = stats_run(options.submissions, options.comments)
+
+    results = [
+        ("Bytes per MiniComment", comment_bytes, options.max_comment_bytes),
+        ("Bytes per MiniSubmission", submission_bytes, options.max_submission_bytes),
+        ("Retained bytes per comment", retained / float(count), None),
+        ("Peak bytes per comment", peak / float(count), options.max_peak_bytes),
+    ]
+    print("Processed {} comments in {:.1f} seconds".format(count, seconds))
+    print("Peak memory: {:.1f} MiB".format(peak / 2.0**20))
+    failed = False
+    for name, value, limit in results:
+        exceeded = limit is not None and value > limit
+        failed = failed or exceeded
+        print(
+            "{}: {:.1f}{}".format(
+                name,
+                value,
+                " (limit {:.0f} exceeded)".format(limit) if exceeded else "",
+            )
+        )
+
+    if not options.skip_gc:
+        plain = stats_run(options.submissions, options.comments, trace=False)[1]
+        collecting = stats_run(
+            options.submissions, options.comments, collect=True, trace=False
+        )[1]
+        print(
+            "Without tracing: {:.1f} seconds, {:.1f} seconds with a full garbage "
+            "collection after every submission".format(plain, collecting)
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,683 @@
 """prawtools.alert provides the reddit_alert command.
 
-This command will alert you when chosen keywords appear in reddit comments.
+This command will alert you when chosen keywords appear in reddit comments or
+submissions.
 
 """
+
 from __future__ import print_function
 
+import json
+import os
 import re
+import signal
 import sys
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+from multiprocessing import Pool, RawValue
+
+from praw.models.util import BoundedSet, ExponentialCounter
+from six.moves import BaseHTTPServer, queue
+
+from .helpers import (
+    arg_parser,
+    check_for_updates,
+    connection_summary,
+    create_reddit,
+    tracer,
+)
+
+
+class MiniComment(
+    namedtuple("MiniComment", "author body created_utc id link_id subreddit")
+):
+    """Provides a compact, picklable version of a Comment."""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_comment(cls, comment):
+        """Return a MiniComment containing the fields needed for alerting."""
+        return cls(
+            str(comment.author) if comment.author else None,
+            comment.body,
+            comment.created_utc,
+            comment.id,
+            comment.link_id,
+            str(comment.subreddit),
+        )
+
+
+class MiniSubmission(
+    namedtuple("MiniSubmission", "author body created_utc id subreddit")
+):
+    """Provides a compact, picklable version of a Submission.
+
+    The ``body`` contains both the title and the selftext so that submissions
+    are matched in the same way as comments.
+
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_submission(cls, submission):
+        """Return a MiniSubmission containing the fields needed for alerting."""
+        return cls(
+            str(submission.author) if submission.author else None,
+            "{}\n\n{}".format(submission.title, submission.selftext),
+            submission.created_utc,
+            submission.id,
+            str(submission.subreddit),
+        )
+
+
+class Result(namedtuple("Result", "keyword comment created_utc seconds")):
+    """The outcome of matching a single comment.
+
+    ``comment`` is only set when ``keyword`` is, which keeps the results of
+    non-matching comments cheap to send between processes.
+
+    """
+
+    __slots__ = ()
+
+
+class Rule(namedtuple("Rule", "keyword subreddits ignore_users")):
+    """A keyword optionally scoped to subreddits and ignoring some users."""
+
+    __slots__ = ()
+
+    def __new__(cls, keyword, subreddits=(), ignore_users=()):
+        """Create a Rule with case-normalized values."""
+        return super(Rule, cls).__new__(
+            cls,
+            keyword.lower(),
+            frozenset(x.lower() for x in subreddits),
+            frozenset(x.lower() for x in ignore_users),
+        )
+
+
+class Matcher(object):
+    """Match comments against a set of keyword rules.
+
+    Rules scoped to subreddits are compiled into a per-subreddit index so that
+    each comment is only searched for the keywords that apply to it. Plain
+    keywords are compiled into a single trie-shaped group, which keeps matching
+    fast with many thousands of keywords, while keywords using regular
+    expression syntax each get a group of their own.
+
+    """
+
+    pattern_characters = frozenset("$()*+.?[\\]^{|}")
+    reg_prefix = r"(?<![a-z])"  # Any character (or start) can precede
+    reg_suffix = r"(?![a-z])"  # Any character (or end) can follow
+
+    def __init__(self, keywords, ignore_users=None, subreddits=None):
+        """Initialize the Matcher.
+
+        :param keywords: A list of keywords, or :class:`.Rule` instances.
+        :param ignore_users: Users whose comments never trigger an alert.
+        :param subreddits: The subreddits to watch (default: all).
+
+        """
+        self.rules = [x if isinstance(x, Rule) else Rule(x) for x in keywords]
+        self.keywords = [rule.keyword for rule in self.rules]
+        self.ignore_users = set(x.lower() for x in ignore_users or ())
+        self.subreddits = sorted(set(subreddits or ()))
+
+        self._default = self._compile(
+            [rule for rule in self.rules if not rule.subreddits]
+        )
+        scoped = set()
+        for rule in self.rules:
+            scoped.update(rule.subreddits)
+        self._index = {
+            subreddit: self._compile(
+                [
+                    rule
+                    for rule in self.rules
+                    if not rule.subreddits or subreddit in rule.subreddits
+                ]
+            )
+            for subreddit in scoped
+        }
+
+    def _compile(self, rules):
+        """Return a (regex, groups, literals) tuple, or None.
+
+        ``groups`` maps the index of each rule's outermost group in the regex
+        to the rule, or to None for the group matching the plain keywords,
+        whose rules are in ``literals``. Keywords may contain groups of their
+        own, which the indexes account for.
+
+        """
+        if not rules:
+            return None
+        literals = {}
+        patterns = []
+        for rule in rules:
+            if self.pattern_characters.intersection(rule.keyword):
+                patterns.append(rule)
+            else:
+                literals.setdefault(rule.keyword, rule)
+        alternatives = []
+        groups = {}
+        if literals:
+            alternatives.append(self._trie(literals))
+            groups[1] = None
+        index = len(groups) + 1
+        for rule in patterns:
+            alternatives.append(rule.keyword)
+            groups[index] = rule
+            index += 1 + re.compile(rule.keyword).groups
+        regex = re.compile(
+            r"{}(?:{}){}".format(
+                self.reg_prefix,
+                "|".join("({})".format(x) for x in alternatives),
+                self.reg_suffix,
+            ),
+            re.IGNORECASE,
+        )
+        return regex, groups, literals
+
+    @staticmethod
+    def _trie(keywords):
+        """Return a regular expression matching any of the plain keywords.
+
+        When one keyword is the prefix of another the longer one is tried
+        first.
+
+        """
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for character in keyword:
+                node = node.setdefault(character, {})
+            node[""] = None
+
+        def pattern(node):
+            branches = [
+                re.escape(character) + pattern(child)
+                for character, child in sorted(node.items())
+                if character
+            ]
+            if not branches:
+                return ""
+            regex = "|".join(branches)
+            if "" in node:
+                return "(?:{})?".format(regex)
+            return regex if len(branches) == 1 else "(?:{})".format(regex)
+
+        return pattern(trie)
+
+    @property
+    def subreddit(self):
+        """Return the subreddit or multireddit whose stream is watched."""
+        return "+".join(self.subreddits) if self.subreddits else "all"
+
+    def match(self, comment):
+        """Return the first keyword found in the comment, or None."""
+        author = comment.author.lower() if comment.author else None
+        if author in self.ignore_users:
+            return None
+        compiled = self._index.get(comment.subreddit.lower(), self._default)
+        if compiled is None:
+            return None
+        regex, groups, literals = compiled
+        for match in regex.finditer(comment.body):
+            keyword = match.group(match.lastindex).lower()
+            rule = groups[match.lastindex] or literals.get(keyword)
+            if rule and author not in rule.ignore_users:
+                return keyword
+        return None
+
+
+class RuleWatcher(threading.Thread):
+    """Reload a rules file in the background whenever it changes."""
+
+    def __init__(self, path, loader, matcher, interval=5, generation=None):
+        """Initialize the RuleWatcher.
+
+        :param path: The path of the rules file to watch.
+        :param loader: A callable returning a new :class:`.Matcher`.
+        :param matcher: The :class:`.Matcher` built from the current file.
+        :param interval: The number of seconds between checks.
+        :param generation: When provided, a shared value incremented upon each
+            successful reload so that matcher processes reload as well.
+
+        """
+        super(RuleWatcher, self).__init__()
+        self.daemon = True
+        self.generation = generation
+        self.interval = interval
+        self.loader = loader
+        self.matcher = matcher
+        self.path = path
+        self._mtime = self._stat()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def check(self):
+        """Reload the rules if the file has changed.
+
+        :returns: True if a new matcher was installed.
+
+        """
+        mtime = self._stat()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            matcher = self.loader()
+        except (IOError, ValueError) as error:
+            sys.stderr.write("Failed to reload {}: {}\n".format(self.path, error))
+            return False
+        self.matcher = matcher  # Swapped in a single, atomic assignment
+        if self.generation is not None:
+            self.generation.value += 1
+        print("Reloaded rules from {}".format(self.path))
+        return True
+
+    def run(self):
+        """Check the rules file for changes until the program exits."""
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+
+class Delivery(threading.Thread):
+    """Deliver alerts from a queue so that slow messaging never stalls matching."""
+
+    def __init__(self, msg_to=None):
+        """Initialize the Delivery thread.
+
+        :param msg_to: When provided, the Redditor to message for each alert.
+
+        """
+        super(Delivery, self).__init__()
+        self.daemon = True
+        self.msg_to = msg_to
+        self.queue = queue.Queue()
+
+    def deliver(self, keyword, comment):
+        """Output a single alert."""
+        url = quick_url(comment)
+        print("{}: {}".format(keyword, url))
+        if self.msg_to:
+            self.msg_to.message(
+                "Reddit Alert: {}".format(keyword),
+                "{}\n\nby /u/{}\n\n---\n\n{}".format(url, comment.author, comment.body),
+            )
+
+    def run(self):
+        """Deliver queued alerts until the program exits."""
+        while True:
+            keyword, comment = self.queue.get()
+            try:
+                with tracer.span("deliver", keyword=keyword):
+                    self.deliver(keyword, comment)
+            except Exception as error:
+                sys.stderr.write("Failed to deliver alert: {}\n".format(error))
+            finally:
+                self.queue.task_done()
+
+
+class Metrics(object):
+    """Track reddit_alert throughput and lag.
+
+    Counters are updated by the thread consuming match results, while rates
+    are recalculated by :meth:`tick`, typically from a :class:`.Reporter`.
+
+    """
+
+    descriptions = (
+        ("comments_total", "counter", "Comments and submissions processed."),
+        ("matches_total", "counter", "Comments that matched a keyword."),
+        ("match_seconds_total", "counter", "Time spent matching comments."),
+        ("comments_per_second", "gauge", "Comments and submissions per second."),
+        ("matches_per_second", "gauge", "Matches per second."),
+        ("match_seconds_per_comment", "gauge", "Average matching time."),
+        ("stream_lag_seconds", "gauge", "Age of the newest processed comment."),
+        ("delivery_queue_depth", "gauge", "Alerts waiting to be delivered."),
+    )
+    prefix = "reddit_alert_"
+
+    def __init__(self, delivery_queue=None):
+        """Initialize the Metrics instance.
+
+        :param delivery_queue: The queue of alerts whose depth is reported.
+
+        """
+        self.comments = 0
+        self.delivery_queue = delivery_queue
+        self.match_seconds = 0.0
+        self.matches = 0
+        self.newest_utc = None
+        self.rates = {"comments": 0.0, "match_seconds": 0.0, "matches": 0.0}
+        self._previous = (time.time(), 0, 0, 0.0)
+
+    def observe(self, result):
+        """Record the :class:`.Result` of matching a comment."""
+        self.comments += 1
+        self.match_seconds += result.seconds
+        if result.keyword:
+            self.matches += 1
+        if self.newest_utc is None or result.created_utc > self.newest_utc:
+            self.newest_utc = result.created_utc
+
+    def render(self, now=None):
+        """Return the metrics in the Prometheus text exposition format."""
+        now = time.time() if now is None else now
+        values = {
+            "comments_total": self.comments,
+            "comments_per_second": self.rates["comments"],
+            "delivery_queue_depth": (
+                self.delivery_queue.qsize() if self.delivery_queue else 0
+            ),
+            "match_seconds_per_comment": self.rates["match_seconds"],
+            "match_seconds_total": self.match_seconds,
+            "matches_per_second": self.rates["matches"],
+            "matches_total": self.matches,
+            "stream_lag_seconds": (
+                max(0.0, now - self.newest_utc) if self.newest_utc else 0.0
+            ),
+        }
+        lines = []
+        for name, kind, text in self.descriptions:
+            name_ = self.prefix + name
+            lines.append("# HELP {} {}".format(name_, text))
+            lines.append("# TYPE {} {}".format(name_, kind))
+            lines.append("{} {}".format(name_, values[name]))
+        return "\n".join(lines) + "\n"
+
+    def tick(self, now=None):
+        """Recalculate rates over the period since the previous tick."""
+        now = time.time() if now is None else now
+        then, comments, matches, match_seconds = self._previous
+        self._previous = (now, self.comments, self.matches, self.match_seconds)
+        elapsed = now - then
+        if elapsed <= 0:
+            return
+        processed = self.comments - comments
+        self.rates = {
+            "comments": processed / elapsed,
+            "match_seconds": (
+                (self.match_seconds - match_seconds) / processed if processed else 0.0
+            ),
+            "matches": (self.matches - matches) / elapsed,
+        }
+
+
+class Reporter(threading.Thread):
+    """Periodically update metrics and write them to a file."""
+
+    def __init__(self, metrics, path=None, interval=15):
+        """Initialize the Reporter.
+
+        :param metrics: The :class:`.Metrics` instance to report on.
+        :param path: When provided, the file to (atomically) write metrics to.
+        :param interval: The number of seconds between updates.
+
+        """
+        super(Reporter, self).__init__()
+        self.daemon = True
+        self.interval = interval
+        self.metrics = metrics
+        self.path = path
+
+    def report(self):
+        """Update the rates and write the metrics file."""
+        self.metrics.tick()
+        if not self.path:
+            return
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as fp:
+            fp.write(self.metrics.render())
+        os.rename(tmp_path, self.path)
+
+    def run(self):
+        """Report metrics until the program exits."""
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.report()
+            except (IOError, OSError) as error:
+                sys.stderr.write("Failed to write metrics: {}\n".format(error))
+
 
-import praw
+def serve_metrics(metrics, port, host="127.0.0.1"):
+    """Serve metrics over HTTP from a background thread.
 
-from .helpers import AGENT, arg_parser, check_for_updates
+    :returns: The HTTP server instance.
+
+    """
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = BaseHTTPServer.HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def load_rules(path, keywords=(), ignore_users=(), subreddits=()):
+    """Return a Matcher built from a JSON rules file.
+
+    The file contains an object with the optional keys ``keywords``,
+    ``ignore_users`` and ``subreddits``. Each keyword is either a string or an
+    object with a ``keyword`` key and optional ``subreddits`` and
+    ``ignore_users`` lists that limit where the keyword applies.
+
+    :param path: The path to the rules file.
+    :param keywords: Additional unscoped keywords.
+    :param ignore_users: Additional users to ignore.
+    :param subreddits: Additional subreddits to watch.
+
+    """
+    with open(path) as fp:
+        data = json.load(fp)
+    if not isinstance(data, dict):
+        raise ValueError("rules must be a JSON object")
+
+    rules = [Rule(x) for x in keywords]
+    for item in data.get("keywords", ()):
+        if not isinstance(item, dict):
+            rules.append(Rule(item))
+        elif "keyword" not in item:
+            raise ValueError("rule {!r} is missing `keyword`".format(item))
+        else:
+            rules.append(
+                Rule(
+                    item["keyword"],
+                    item.get("subreddits", ()),
+                    item.get("ignore_users", ()),
+                )
+            )
+    if not rules:
+        raise ValueError("at least one keyword must be provided")
+    for rule in rules:
+        try:
+            re.compile(rule.keyword)
+        except re.error as error:
+            raise ValueError("invalid keyword {!r}: {}".format(rule.keyword, error))
+    return Matcher(
+        rules,
+        list(ignore_users) + data.get("ignore_users", []),
+        list(subreddits) + data.get("subreddits", []),
+    )
+
+
+_worker = {"generation": None, "loaded": 0, "loader": None, "matcher": None}
+
+
+def _init_worker(matcher, loader=None, generation=None):
+    """Prepare a matcher process; the parent handles KeyboardInterrupt."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker.update(generation=generation, loaded=0, loader=loader, matcher=matcher)
+
+
+def _match_worker(comment):
+    """Return the :class:`.Result` of matching the comment."""
+    generation = _worker["generation"]
+    if generation is not None and generation.value != _worker["loaded"]:
+        try:
+            _worker["matcher"] = _worker["loader"]()
+            _worker["loaded"] = generation.value
+        except (IOError, ValueError):
+            pass  # Keep the previous rules; the next comment will retry
+    return timed_match(_worker["matcher"], comment)
+
+
+def item_stream(session, current_matcher, submissions=False):
+    """Yield MiniComments and MiniSubmissions from the watched subreddits.
+
+    When both comments and submissions are watched the two streams take turns,
+    one request each, through the same session so that they share its rate
+    limit. When a round of requests finds nothing new the next round is
+    delayed, by up to 16 seconds, so that quiet subreddits do not use up the
+    rate limit shared with alert delivery. Streams are restarted whenever the
+    watched subreddits change.
+
+    :param session: The :class:`praw.Reddit` instance to stream from.
+    :param current_matcher: A callable returning the active :class:`.Matcher`.
+    :param submissions: Also yield submissions (default: False).
+
+    """
+    seen = BoundedSet(602)
+    while True:
+        subreddit = current_matcher().subreddit
+        stream = session.subreddit(subreddit).stream
+        streams = [(stream.comments(pause_after=-1), MiniComment.from_comment)]
+        if submissions:
+            streams.append(
+                (stream.submissions(pause_after=-1), MiniSubmission.from_submission)
+            )
+        backoff = ExponentialCounter(max_counter=16)
+        while current_matcher().subreddit == subreddit:
+            found = False
+            for generator, convert in streams:
+                for item in generator:
+                    if item is None:
+                        break  # A single response was consumed; switch streams
+                    if item.fullname not in seen:
+                        found = True
+                        seen.add(item.fullname)
+                        yield convert(item)
+            if found:
+                backoff.reset()
+            else:
+                time.sleep(backoff.counter())
+
+
+def read_corpus(path):
+    """Yield the MiniComments and MiniSubmissions recorded in a corpus file.
+
+    A corpus file contains one JSON object per line, as written by
+    :func:`record_items`.
+
+    """
+    with open(path) as fp:
+        for line in fp:
+            if line.strip():
+                data = json.loads(line)
+                if "link_id" in data:
+                    yield MiniComment(**data)
+                else:
+                    yield MiniSubmission(**data)
+
+
+def record_items(items, fp):
+    """Yield each item after appending it to a corpus file.
+
+    :param items: An iterable of MiniComments and MiniSubmissions.
+    :param fp: The file object to write JSON lines to.
+
+    """
+    for item in items:
+        fp.write(json.dumps(item._asdict(), sort_keys=True) + "\n")
+        yield item
+
+
+def timed_match(matcher, comment):
+    """Return the :class:`.Result` of matching the comment with matcher."""
+    start = time.time()
+    keyword = matcher.match(comment)
+    return Result(
+        keyword,
+        comment if keyword else None,
+        comment.created_utc,
+        time.time() - start,
+    )
+
+
+def match_items(items, current_matcher, pool=None, batch_size=1):
+    """Yield the :class:`.Result` of matching each item, in order.
+
+    The items can come from :func:`item_stream`, or from a recorded or
+    synthetic corpus so that matching can be measured without reddit.
+
+    :param items: An iterable of MiniComments and MiniSubmissions.
+    :param current_matcher: A callable returning the active :class:`.Matcher`.
+    :param pool: When provided, the pool returned by :func:`matcher_pool` to
+        match items in (default: match in this process).
+    :param batch_size: The number of items handed to a matcher process at once
+        (default: 1).
+
+    """
+    if pool is None:
+        for item in items:
+            yield timed_match(current_matcher(), item)
+    else:
+        for result in pool.imap(_match_worker, items, batch_size):
+            yield result
+
+
+def matcher_pool(processes, matcher, loader=None, generation=None):
+    """Return a pool of processes for :func:`match_items` to match items in.
+
+    Create the pool before starting any threads, as forking a process while
+    other threads hold locks can deadlock the child.
+
+    :param processes: The number of processes.
+    :param matcher: The :class:`.Matcher` the processes start with.
+    :param loader: When provided, a callable the processes use to reload their
+        :class:`.Matcher`.
+    :param generation: A shared value whose change prompts that reload.
+
+    """
+    return Pool(processes, _init_worker, (matcher, loader, generation))
 
 
 def quick_url(comment):
     """Return the URL for the comment without fetching its submission."""
+    if isinstance(comment, MiniSubmission):
+        return "http://www.reddit.com/r/{}/comments/{}/".format(
+            comment.subreddit, comment.id
+        )
 
     def to_id(fullname):
         return fullname.split("_", 1)[1]
 
     return "http://www.reddit.com/r/{}/comments/{}/_/{}?context=3".format(
-        comment.subreddit.display_name, to_id(comment.link_id), comment.id
+        comment.subreddit, to_id(comment.link_id), comment.id
     )
 
 
@@ -53,62 +710,172 @@ def main():
         metavar="USER",
         help=("When set, send a reddit message to USER with the " "alert."),
     )
+    parser.add_option(
+        "-t",
+        "--submissions",
+        action="store_true",
+        help=(
+            "Also alert on keywords in submission titles and selftext. "
+            "Submissions and comments share a single connection."
+        ),
+    )
+    parser.add_option(
+        "-r",
+        "--rules",
+        metavar="FILE",
+        help=(
+            "Load additional keywords, subreddits and ignored users from a "
+            "JSON rules file. The file is reloaded whenever it changes."
+        ),
+    )
+    parser.add_option(
+        "",
+        "--metrics-file",
+        metavar="FILE",
+        help=(
+            "Periodically write throughput and stream lag metrics to FILE "
+            "in the Prometheus text format."
+        ),
+    )
+    parser.add_option(
+        "",
+        "--metrics-port",
+        type="int",
+        metavar="PORT",
+        help="Serve the metrics at http://127.0.0.1:PORT/.",
+    )
+    parser.add_option(
+        "",
+        "--metrics-interval",
+        type="int",
+        default=15,
+        metavar="SECONDS",
+        help="The number of seconds between metric updates. [default %default]",
+    )
+    parser.add_option(
+        "-P",
+        "--processes",
+        type="int",
+        default=1,
+        help=(
+            "The number of processes used to match comments. When greater "
+            "than 1 comments are matched in parallel and alerts are still "
+            "reported in stream order. [default %default]"
+        ),
+    )
+    parser.add_option(
+        "",
+        "--batch-size",
+        type="int",
+        default=1,
+        help=(
+            "The number of comments handed to a matcher process at once "
+            "when --processes is greater than 1. [default %default]"
+        ),
+    )
+    parser.add_option(
+        "",
+        "--record",
+        metavar="FILE",
+        help=(
+            "Append every comment and submission received to FILE, a corpus "
+            "that benchmarks/alert_matching.py can replay."
+        ),
+    )
     options, args = parser.parse_args()
-    if not args:
-        parser.error("At least one KEYWORD must be provided.")
+    if not args and not options.rules:
+        parser.error("At least one KEYWORD or --rules must be provided.")
+    if options.processes < 1 or options.batch_size < 1:
+        parser.error("--processes and --batch-size must be at least 1.")
 
-    session = praw.Reddit(options.site, check_for_updates=False, user_agent=AGENT)
+    loader = generation = watcher = None
+    if options.rules:
+        loader = partial(
+            load_rules,
+            options.rules,
+            args,
+            options.ignore_user or (),
+            options.subreddit or (),
+        )
+        try:
+            matcher = loader()
+        except (IOError, ValueError) as error:
+            parser.error("Invalid rules file {}: {}".format(options.rules, error))
+        if options.processes > 1:
+            generation = RawValue("i", 0)
+        watcher = RuleWatcher(options.rules, loader, matcher, generation=generation)
+    else:
+        try:
+            matcher = Matcher(args, options.ignore_user, options.subreddit)
+        except re.error as error:
+            parser.error("Invalid keyword: {}".format(error))
 
-    if options.message:
-        msg_to = session.redditor(options.message)
+    def current_matcher():
+        return watcher.matcher if watcher else matcher
 
-    check_for_updates(options)
-
-    # Build regex
-    args = [x.lower() for x in args]
-    reg_prefix = r"(?:^|[^a-z])"  # Any character (or start) can precede
-    reg_suffix = r"(?:$|[^a-z])"  # Any character (or end) can follow
-    regex = re.compile(
-        r"{}({}){}".format(reg_prefix, "|".join(args), reg_suffix), re.IGNORECASE
+    # The stream and the delivery thread each use a connection
+    session = create_reddit(
+        options.site, 2, options.timeout, options.cache, options.cache_size
     )
 
-    # Determine subreddit or multireddit
-    if options.subreddit:
-        subreddit = "+".join(sorted(options.subreddit))
-    else:
-        subreddit = "all"
+    delivery = Delivery(session.redditor(options.message) if options.message else None)
+    metrics = Metrics(delivery.queue)
+
+    if options.trace:
+        tracer.open(options.trace)
+    check_for_updates(options)
 
     print("Alerting on:")
-    for item in sorted(args):
-        print(" * {}".format(item))
+    for rule in sorted(matcher.rules):
+        if rule.subreddits:
+            print(
+                " * {} (in {})".format(rule.keyword, ", ".join(sorted(rule.subreddits)))
+            )
+        else:
+            print(" * {}".format(rule.keyword))
     print(
         "using the comment stream: https://www.reddit.com/r/{}/comments".format(
-            subreddit
+            matcher.subreddit
         )
     )
+    if options.submissions:
+        print(
+            "and the submission stream: https://www.reddit.com/r/{}/new".format(
+                matcher.subreddit
+            )
+        )
 
-    # Build ignore set
-    if options.ignore_user:
-        ignore_users = set(x.lower() for x in options.ignore_user)
-    else:
-        ignore_users = set()
+    pool = None
+    if options.processes > 1:  # Fork before any other thread is started
+        pool = matcher_pool(options.processes, matcher, loader, generation)
+    if watcher:
+        watcher.start()
+    delivery.start()
+    if options.metrics_file or options.metrics_port:
+        Reporter(metrics, options.metrics_file, options.metrics_interval).start()
+    if options.metrics_port:
+        serve_metrics(metrics, options.metrics_port)
+
+    items = item_stream(session, current_matcher, options.submissions)
+    record = open(options.record, "a") if options.record else None
+    if record:
+        items = record_items(items, record)
+    results = match_items(items, current_matcher, pool, options.batch_size)
 
     try:
-        for comment in session.subreddit(subreddit).stream.comments():
-            if comment.author and comment.author.name.lower() in ignore_users:
-                continue
-            match = regex.search(comment.body)
-            if match:
-                keyword = match.group(1).lower()
-                url = quick_url(comment)
-                print("{}: {}".format(keyword, url))
-                if options.message:
-                    msg_to.message(
-                        "Reddit Alert: {}".format(keyword),
-                        "{}\n\nby /u/{}\n\n---\n\n{}".format(
-                            url, comment.author, comment.body
-                        ),
-                    )
+        for result in results:
+            tracer.complete("match", result.seconds, keyword=result.keyword)
+            metrics.observe(result)
+            if result.keyword:
+                delivery.queue.put((result.keyword, result.comment))
     except KeyboardInterrupt:
         sys.stderr.write("\n")
         print("Goodbye!\n")
+    finally:
+        if pool:
+            pool.terminate()
+        if record:
+            record.close()
+        if options.verbose:
+            for line in connection_summary(session):
+                sys.stderr.write(line + "\n")
@@ -0,0 +1,784 @@
+"""prawtools.fake provides the fake_reddit command.
+
+This command serves a local stand-in for the parts of the reddit API used by
+the prawtools commands so that they can be load tested offline. It generates
+synthetic subreddit listings, comment trees containing "load more comments"
+stubs, a comment stream, flair lists, relationship lists and moderation logs
+at a configurable volume and latency, and reports rate limit headers like
+reddit does.
+
+"""
+from __future__ import print_function
+
+import csv
+import gzip
+import io
+import json
+import random
+import re
+import threading
+import time
+from optparse import OptionParser
+
+from praw import Reddit
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qsl, urlsplit
+
+from . import __version__
+
+COMMENT_BASE = 36**6  # The first comment number, making ids look like reddit's
+COMMENT_STRIDE = 10**6  # The maximum number of comments in a submission
+MODLOG_INTERVAL = 600  # The number of seconds between moderation log entries
+STREAM_BASE = 36**7  # The first comment number in the comment stream
+SUBMISSION_BASE = 36**5  # The first submission number
+TOP_WINDOWS = {
+    "all": None,
+    "day": 86400,
+    "hour": 3600,
+    "month": 86400 * 30,
+    "week": 86400 * 7,
+    "year": 86400 * 365,
+}
+WORDS = (
+    "about after again also back because before being between both could "
+    "down each even first from good great have here into just know like "
+    "little long make many more most much must never only other over people "
+    "reddit right same should since some still such take than that their "
+    "them then there these they thing think this those through time under "
+    "very well what when where which while with work would year your"
+).split()
+
+
+def base36(number):
+    """Return the base 36 representation of `number`."""
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    result = ""
+    while True:
+        number, remainder = divmod(number, 36)
+        result = digits[remainder] + result
+        if not number:
+            return result
+
+
+def listing(children, after=None, before=None):
+    """Return a Listing object containing `children`."""
+    return {
+        "kind": "Listing",
+        "data": {
+            "after": after,
+            "before": before,
+            "children": children,
+            "dist": len(children),
+        },
+    }
+
+
+class Api(object):
+    """Answer reddit API requests with the data of a :class:`.FakeReddit`."""
+
+    routes = (
+        ("POST", r"api/v1/access_token", "access_token"),
+        ("GET", r"api/v1/me", "me"),
+        ("GET", r"comments/(?P<submission_id>\w+)", "comments"),
+        ("POST", r"api/morechildren", "morechildren"),
+        ("POST", r"api/submit", "submit"),
+        ("GET", r"r/(?P<subreddit>\w+)/about", "about"),
+        ("GET", r"r/(?P<subreddit>\w+)/about/log", "modlog"),
+        ("GET", r"r/(?P<subreddit>\w+)/about/(?P<relationship>\w+)", "users"),
+        ("GET", r"r/(?P<subreddit>\w+)/api/flairlist", "flairlist"),
+        ("POST", r"r/(?P<subreddit>\w+)/api/flaircsv", "flaircsv"),
+        ("GET", r"r/(?P<subreddit>\w+)/api/(?:user|link)_flair_v2", "templates"),
+        ("GET", r"r/(?P<subreddit>\w+)/comments", "stream"),
+        (
+            "GET",
+            r"r/(?P<subreddit>\w+)/comments/(?P<submission_id>\w+)(?:/.*)?",
+            "comments",
+        ),
+        ("GET", r"r/(?P<subreddit>\w+)(?:/(?P<sort>hot|new|top))?", "submissions"),
+    )
+
+    def __init__(self, fake):
+        """Initialize the Api with the :class:`.FakeReddit` providing the data."""
+        self.fake = fake
+
+    def dispatch(self, method, path, params):
+        """Return the response body for a request, or None when not found.
+
+        :param method: The HTTP method.
+        :param path: The request path without leading and trailing slashes.
+        :param params: A dictionary of the query and form parameters.
+
+        """
+        for route_method, pattern, name in self.routes:
+            match = re.match(pattern + "$", path)
+            if route_method == method and match:
+                return getattr(self, "handle_" + name)(params, **match.groupdict())
+        return None if method == "GET" else {"json": {"errors": []}}
+
+    def handle_about(self, params, subreddit):
+        """Answer a subreddit's about request."""
+        return {
+            "kind": "t5",
+            "data": {
+                "display_name": subreddit,
+                "id": base36(len(subreddit)),
+                "name": "t5_" + base36(len(subreddit)),
+                "subscribers": self.fake.users,
+            },
+        }
+
+    def handle_access_token(self, params):
+        """Answer an access token request with a token valid for an hour."""
+        return {
+            "access_token": "fake",
+            "expires_in": 3600,
+            "scope": "*",
+            "token_type": "bearer",
+        }
+
+    def handle_comments(self, params, submission_id, subreddit="fake"):
+        """Answer a submission's comments request."""
+        return self.fake.comment_tree(subreddit, submission_id)
+
+    def handle_flaircsv(self, params, subreddit):
+        """Answer a bulk flair update."""
+        rows = csv.reader(io.StringIO(params.get("flair_csv", "")))
+        return self.fake.set_flair(rows)
+
+    def handle_flairlist(self, params, subreddit):
+        """Answer a page of the flair list."""
+        limit = min(int(params.get("limit") or 1000), 1000)
+        return self.fake.flair_list(params.get("after"), limit)
+
+    def handle_me(self, params):
+        """Answer a request for the authenticated user."""
+        return {"id": "1", "name": "fake"}
+
+    def handle_modlog(self, params, subreddit):
+        """Answer a page of the moderation log."""
+        limit = min(int(params.get("limit") or 100), 500)
+        return self.fake.modlog(subreddit, params.get("after"), limit)
+
+    def handle_morechildren(self, params):
+        """Answer a request for comments hidden behind a stub."""
+        children = [x for x in params.get("children", "").split(",") if x]
+        return self.fake.more_children(params.get("link_id", ""), children)
+
+    def handle_stream(self, params, subreddit):
+        """Answer a request for the newest comments."""
+        limit = min(int(params.get("limit") or 100), 100)
+        return self.fake.stream(subreddit, params.get("before"), limit)
+
+    def handle_submissions(self, params, subreddit, sort=None):
+        """Answer a page of a subreddit's submissions."""
+        if params.get("before"):  # No new submissions appear
+            return listing([])
+        limit = min(int(params.get("limit") or 25), 100)
+        window = TOP_WINDOWS.get(params.get("t")) if sort == "top" else None
+        return self.fake.submission_listing(
+            subreddit, params.get("after"), limit, window
+        )
+
+    def handle_submit(self, params):
+        """Answer a submission request as if the submission was created."""
+        submission_id = base36(SUBMISSION_BASE)
+        return {
+            "json": {
+                "errors": [],
+                "data": {
+                    "id": submission_id,
+                    "name": "t3_" + submission_id,
+                    "url": "https://www.reddit.com/comments/{}/".format(submission_id),
+                },
+            }
+        }
+
+    def handle_templates(self, params, subreddit):
+        """Answer a request for the flair templates."""
+        return []
+
+    def handle_users(self, params, subreddit, relationship):
+        """Answer a page of a subreddit relationship."""
+        limit = min(int(params.get("limit") or 100), 100)
+        return self.fake.user_list(relationship, params.get("after"), limit)
+
+
+class FakeReddit(object):
+    """Generate the synthetic data served by the fake reddit API.
+
+    All data is derived from the seed and the position of an item, so that it
+    is identical between requests and runs without being kept in memory. Only
+    the flair assigned through the API is stored.
+
+    """
+
+    def __init__(
+        self,
+        submissions=1000,
+        comments=100,
+        visible=50,
+        stream_rate=10.0,
+        users=1000,
+        interval=3600,
+        seed=0,
+    ):
+        """Initialize the FakeReddit instance.
+
+        :param submissions: The number of submissions in each subreddit.
+        :param comments: The average number of comments per submission.
+        :param visible: The number of comments returned with a submission.
+            The remaining comments are hidden behind "load more comments"
+            stubs.
+        :param stream_rate: The number of new comments per second in the
+            comment stream.
+        :param users: The number of distinct users, all of which have flair.
+        :param interval: The number of seconds between submissions.
+        :param seed: The seed from which all data is derived.
+
+        """
+        self.comments = comments
+        self.interval = interval
+        self.seed = seed
+        self.started = time.time()
+        self.stream_rate = stream_rate
+        self.submissions = submissions
+        self.users = users
+        self.visible = visible
+        self._flair = {}
+        self._lock = threading.Lock()
+
+    def _body(self, rng):
+        return " ".join(
+            rng.choice(WORDS) for _ in range(int(rng.expovariate(1 / 20.0)) + 1)
+        )
+
+    def _comment(self, subreddit, index, number, parents, depth):
+        rng = self._random("comment", index, number)
+        created = self._created(index) + 60 * (number + 1)
+        link_id = "t3_" + self._submission_id(index)
+        parent = parents[number]
+        return {
+            "author": self._user(rng),
+            "body": self._body(rng),
+            "created_utc": created,
+            "depth": depth,
+            "distinguished": None,
+            "id": self._comment_id(index, number),
+            "link_id": link_id,
+            "name": "t1_" + self._comment_id(index, number),
+            "parent_id": (
+                link_id if parent < 0 else "t1_" + self._comment_id(index, parent)
+            ),
+            "permalink": "/r/{}/comments/{}/_/{}/".format(
+                subreddit, self._submission_id(index), self._comment_id(index, number)
+            ),
+            "replies": "",
+            "score": int(rng.paretovariate(1.5)),
+            "subreddit": subreddit,
+        }
+
+    def _comment_count(self, index):
+        if not self.comments:
+            return 0
+        return self._random("count", index).randint(0, 2 * self.comments)
+
+    @staticmethod
+    def _comment_id(index, number):
+        return base36(COMMENT_BASE + index * COMMENT_STRIDE + number)
+
+    def _created(self, index):
+        return int(self.started - self.interval * index)
+
+    def _parents(self, index):
+        rng = self._random("tree", index)
+        parents = []
+        for number in range(self._comment_count(index)):
+            if number == 0 or rng.random() < 0.4:
+                parents.append(-1)
+            else:
+                parents.append(rng.randrange(number))
+        return parents
+
+    def _random(self, *key):
+        return random.Random("/".join(str(part) for part in (self.seed,) + key))
+
+    def _submission(self, subreddit, index):
+        rng = self._random("submission", index)
+        submission_id = self._submission_id(index)
+        permalink = "/r/{}/comments/{}/_/".format(subreddit, submission_id)
+        return {
+            "author": self._user(rng),
+            "created_utc": self._created(index),
+            "distinguished": None,
+            "id": submission_id,
+            "is_self": True,
+            "name": "t3_" + submission_id,
+            "num_comments": self._comment_count(index),
+            "over_18": False,
+            "permalink": permalink,
+            "score": int(rng.paretovariate(1.2)),
+            "selftext": self._body(rng),
+            "subreddit": subreddit,
+            "title": self._body(rng)[:300],
+            "url": "https://www.reddit.com" + permalink,
+        }
+
+    @staticmethod
+    def _submission_id(index):
+        return base36(SUBMISSION_BASE + index)
+
+    def _thread(self, subreddit, index, numbers, children, parents, budget, depth):
+        things = []
+        for position, number in enumerate(numbers):
+            if budget[0] <= 0:
+                hidden = []
+                pending = list(reversed(numbers[position:]))
+                while pending:
+                    current = pending.pop()
+                    hidden.append(current)
+                    pending.extend(reversed(children.get(current, ())))
+                parent = parents[number]
+                link_id = "t3_" + self._submission_id(index)
+                more_id = self._comment_id(index, number)
+                things.append(
+                    {
+                        "kind": "more",
+                        "data": {
+                            "children": [self._comment_id(index, x) for x in hidden],
+                            "count": len(hidden),
+                            "depth": depth,
+                            "id": more_id,
+                            "name": "t1_" + more_id,
+                            "parent_id": (
+                                link_id
+                                if parent < 0
+                                else "t1_" + self._comment_id(index, parent)
+                            ),
+                        },
+                    }
+                )
+                break
+            budget[0] -= 1
+            data = self._comment(subreddit, index, number, parents, depth)
+            replies = self._thread(
+                subreddit,
+                index,
+                children.get(number, []),
+                children,
+                parents,
+                budget,
+                depth + 1,
+            )
+            if replies:
+                data["replies"] = listing(replies)
+            things.append({"kind": "t1", "data": data})
+        return things
+
+    def _user(self, rng):
+        return "user{}".format(rng.randrange(self.users))
+
+    def comment_tree(self, subreddit, submission_id):
+        """Return the submission and its visible comments.
+
+        Comments beyond the first `visible` comments, in depth-first order,
+        are replaced by "load more comments" stubs listing all of their ids.
+
+        """
+        index = int(submission_id, 36) - SUBMISSION_BASE
+        if not 0 <= index < self.submissions:
+            return None
+        parents = self._parents(index)
+        children = {}
+        for number, parent in enumerate(parents):
+            children.setdefault(parent, []).append(number)
+        comments = self._thread(
+            subreddit,
+            index,
+            children.get(-1, []),
+            children,
+            parents,
+            [self.visible],
+            0,
+        )
+        submission = {"kind": "t3", "data": self._submission(subreddit, index)}
+        return [listing([submission]), listing(comments)]
+
+    def flair_list(self, after=None, limit=1000):
+        """Return a page of the flair list in the format of /api/flairlist."""
+        start = int(after[4:]) + 1 if after else 0
+        users = []
+        for number in range(start, min(start + limit, self.users)):
+            name = "user{}".format(number)
+            text, css = self._flair.get(name, ("flair {}".format(number % 50), ""))
+            users.append({"flair_css_class": css, "flair_text": text, "user": name})
+        following = start + limit
+        return {
+            "next": "user{}".format(following - 1) if following < self.users else None,
+            "users": users,
+        }
+
+    def modlog(self, subreddit, after=None, limit=100):
+        """Return a page of the moderation log, newest entry first."""
+        start = int(after.split("_", 1)[1]) + 1 if after else 0
+        entries = self.submissions * 4
+        children = []
+        for number in range(start, min(start + limit, entries)):
+            rng = self._random("modlog", number)
+            children.append(
+                {
+                    "kind": "modaction",
+                    "data": {
+                        "action": rng.choice(
+                            ("approvelink", "banuser", "removecomment", "removelink")
+                        ),
+                        "created_utc": int(self.started - MODLOG_INTERVAL * number),
+                        "description": None,
+                        "details": None,
+                        "id": "ModAction_{}".format(number),
+                        "mod": "mod{}".format(rng.randrange(5)),
+                        "subreddit": subreddit,
+                        "target_author": self._user(rng),
+                    },
+                }
+            )
+        following = start + limit
+        after = "ModAction_{}".format(following - 1) if following < entries else None
+        return listing(children, after)
+
+    def more_children(self, link_id, children):
+        """Return the comments with the given ids in /api/morechildren format."""
+        index = int(link_id[3:], 36) - SUBMISSION_BASE
+        parents = self._parents(index)
+        depths = []
+        for parent in parents:
+            depths.append(0 if parent < 0 else depths[parent] + 1)
+        things = []
+        for comment_id in children:
+            number = int(comment_id, 36) - COMMENT_BASE - index * COMMENT_STRIDE
+            if 0 <= number < len(parents):
+                data = self._comment("fake", index, number, parents, depths[number])
+                things.append({"kind": "t1", "data": data})
+        return {"json": {"errors": [], "data": {"things": things}}}
+
+    def set_flair(self, rows):
+        """Store flair from the CSV rows sent to /api/flaircsv."""
+        results = []
+        with self._lock:
+            for row in rows:
+                user, text, css = (row + ["", ""])[:3]
+                self._flair[user] = (text, css)
+                results.append(
+                    {
+                        "errors": {},
+                        "ok": True,
+                        "status": "added flair for user {}".format(user),
+                        "warnings": {},
+                    }
+                )
+        return results
+
+    def stream(self, subreddit, before=None, limit=100):
+        """Return the newest comments of the comment stream, newest first.
+
+        :param before: When provided, only comments newer than the comment
+            with this fullname are returned.
+
+        """
+        now = time.time()
+        total = int((now - self.started) * self.stream_rate)
+        oldest = int(before[3:], 36) - STREAM_BASE + 1 if before else 0
+        children = []
+        for number in range(total - 1, max(oldest, total - limit) - 1, -1):
+            rng = self._random("stream", number)
+            comment_id = base36(STREAM_BASE + number)
+            link_id = "t3_" + self._submission_id(rng.randrange(self.submissions))
+            where = (
+                "sub{}".format(rng.randrange(50)) if subreddit == "all" else subreddit
+            )
+            data = {
+                "author": self._user(rng),
+                "body": self._body(rng),
+                "created_utc": int(self.started + number / self.stream_rate),
+                "distinguished": None,
+                "id": comment_id,
+                "link_id": link_id,
+                "name": "t1_" + comment_id,
+                "parent_id": link_id,
+                "permalink": "/r/{}/comments/{}/_/{}/".format(
+                    where, link_id[3:], comment_id
+                ),
+                "replies": "",
+                "score": 1,
+                "subreddit": where,
+            }
+            children.append({"kind": "t1", "data": data})
+        return listing(children)
+
+    def submission_listing(self, subreddit, after=None, limit=100, window=None):
+        """Return a page of submissions, newest first.
+
+        :param window: When provided, only submissions created within this
+            number of seconds are included.
+
+        """
+        start = int(after[3:], 36) - SUBMISSION_BASE + 1 if after else 0
+        total = self.submissions
+        if window is not None:
+            total = min(total, int(window // self.interval) + 1)
+        end = min(start + limit, total)
+        children = [
+            {"kind": "t3", "data": self._submission(subreddit, index)}
+            for index in range(start, end)
+        ]
+        after = children[-1]["data"]["name"] if children and end < total else None
+        return listing(children, after)
+
+    def user_list(self, relationship, after=None, limit=100):
+        """Return a page of the users in `relationship`."""
+        total = 5 if relationship == "moderators" else self.users // 10
+        start = int(after[3:], 36) + 1 if after else 0
+        children = []
+        for number in range(start, min(start + limit, total)):
+            prefix = "mod" if relationship == "moderators" else "user"
+            user = {
+                "date": int(self.started),
+                "id": "t2_" + base36(number),
+                "name": "{}{}".format(prefix, number),
+            }
+            if relationship == "moderators":
+                user["mod_permissions"] = ["all"]
+            children.append(user)
+        if relationship == "moderators":
+            return {"kind": "UserList", "data": {"children": children}}
+        following = start + limit
+        after = "t2_" + base36(following - 1) if following < total else None
+        return listing(children, after)
+
+
+class RateLimit(object):
+    """Track requests against a fixed window rate limit like reddit's."""
+
+    def __init__(self, limit=600, window=600):
+        """Initialize the RateLimit allowing `limit` requests per `window`."""
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._reset = 0
+        self._used = 0
+
+    def hit(self, now=None):
+        """Count a request.
+
+        :returns: A tuple (allowed, headers) where headers are the rate limit
+            headers to send with the response.
+
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if now >= self._reset:
+                self._reset = now - now % self.window + self.window
+                self._used = 0
+            self._used += 1
+            used = self._used
+        headers = {
+            "x-ratelimit-remaining": str(float(max(0, self.limit - used))),
+            "x-ratelimit-reset": str(int(self._reset - now)),
+            "x-ratelimit-used": str(used),
+        }
+        return used <= self.limit, headers
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer requests to the fake reddit API."""
+
+    disable_nagle_algorithm = True  # Otherwise each response waits for an ACK
+    protocol_version = "HTTP/1.1"
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        if method == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            params.update(parse_qsl(self.rfile.read(length).decode("utf-8")))
+        path = url.path.strip("/")
+        if path.endswith(".json"):
+            path = path[:-5]
+
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency * random.uniform(0.5, 1.5))
+        headers = {}
+        if path != "api/v1/access_token":
+            allowed, headers = server.rate_limit.hit()
+            if not allowed:
+                return self._respond(
+                    429, {"error": 429, "message": "Too Many Requests"}
+                )
+
+        body = server.api.dispatch(method, path, params)
+        if body is None:
+            return self._respond(404, {"error": 404, "message": "Not Found"}, headers)
+        self._respond(200, body, headers)
+
+    def _respond(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            buffer = io.BytesIO()
+            with gzip.GzipFile(fileobj=buffer, mode="wb") as fp:
+                fp.write(data)
+            data = buffer.getvalue()
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        """Answer a GET request."""
+        self._dispatch("GET")
+
+    def do_POST(self):
+        """Answer a POST request."""
+        self._dispatch("POST")
+
+    def log_message(self, *args):
+        """Do not log requests."""
+
+
+class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """An HTTP server answering each connection in its own thread."""
+
+    daemon_threads = True
+
+    def __init__(self, address, fake, latency=0, rate_limit=None):
+        """Initialize the Server.
+
+        :param address: A (host, port) tuple. Use port 0 for any free port.
+        :param fake: The :class:`.FakeReddit` instance providing the data.
+        :param latency: The average number of seconds to delay each response.
+        :param rate_limit: The :class:`.RateLimit` applied to the requests.
+
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.api = Api(fake)
+        self.fake = fake
+        self.latency = latency
+        self.rate_limit = rate_limit or RateLimit()
+
+
+def offline_reddit(fake, **config):
+    """Return a :class:`praw.Reddit` instance whose requests `fake` answers.
+
+    Requests are answered in-process rather than over HTTP, so that
+    benchmarks can exercise the code using the instance without measuring a
+    server.
+
+    :param fake: The :class:`.FakeReddit` instance providing the data.
+    :param config: Additional :class:`praw.Reddit` settings.
+
+    """
+    api = Api(fake)
+    reddit = Reddit(
+        check_for_updates=False,
+        client_id="fake",
+        client_secret="fake",
+        user_agent="prawtools offline reddit",
+        **config
+    )
+
+    def request(method, path, params=None, data=None, files=None):
+        merged = dict(params or {})
+        merged.update(data or {})
+        return api.dispatch(method, path.strip("/"), merged)
+
+    reddit.request = request
+    return reddit
+
+
+def main():
+    """Provide the entry point into the fake_reddit command."""
+    msg = {
+        "comments": "The average number of comments per submission [default: %default].",
+        "host": "The address to listen on [default: %default].",
+        "interval": "The number of seconds between submissions [default: %default].",
+        "latency": (
+            "The average number of seconds to delay each response "
+            "[default: %default]."
+        ),
+        "port": "The port to listen on [default: %default].",
+        "rate_limit": (
+            "The number of requests allowed per rate limit window. Requests "
+            "beyond it are answered with status 429 [default: %default]."
+        ),
+        "seed": "The seed from which all data is derived [default: %default].",
+        "stream_rate": (
+            "The number of new comments per second in the comment stream "
+            "[default: %default]."
+        ),
+        "submissions": "The number of submissions per subreddit [default: %default].",
+        "users": "The number of distinct users [default: %default].",
+        "visible": (
+            "The number of comments returned with a submission; the remaining "
+            'comments are hidden behind "load more comments" stubs '
+            "[default: %default]."
+        ),
+        "window": "The rate limit window in seconds [default: %default].",
+    }
+
+    parser = OptionParser(
+        usage="Usage: %prog [options]",
+        version="BBoe's PRAWtools {}".format(__version__),
+    )
+    parser.add_option("--host", default="127.0.0.1", help=msg["host"])
+    parser.add_option("-p", "--port", type="int", default=65010, help=msg["port"])
+    parser.add_option(
+        "--submissions", type="int", default=1000, help=msg["submissions"]
+    )
+    parser.add_option("--comments", type="int", default=100, help=msg["comments"])
+    parser.add_option("--visible", type="int", default=50, help=msg["visible"])
+    parser.add_option(
+        "--stream-rate", type="float", default=10.0, help=msg["stream_rate"]
+    )
+    parser.add_option("--users", type="int", default=1000, help=msg["users"])
+    parser.add_option("--interval", type="int", default=3600, help=msg["interval"])
+    parser.add_option("--seed", type="int", default=0, help=msg["seed"])
+    parser.add_option("--latency", type="float", default=0.0, help=msg["latency"])
+    parser.add_option("--rate-limit", type="int", default=600, help=msg["rate_limit"])
+    parser.add_option("--window", type="int", default=600, help=msg["window"])
+
+    options, args = parser.parse_args()
+    if args:
+        parser.error("No arguments are accepted.")
+    if options.submissions < 1 or options.users < 1 or options.interval < 1:
+        parser.error("--submissions, --users and --interval must be at least 1.")
+
+    fake = FakeReddit(
+        options.submissions,
+        options.comments,
+        options.visible,
+        options.stream_rate,
+        options.users,
+        options.interval,
+        options.seed,
+    )
+    server = Server(
+        (options.host, options.port),
+        fake,
+        options.latency,
+        RateLimit(options.rate_limit, options.window),
+    )
+    url = "http://{}:{}".format(*server.server_address[:2])
+    print("Serving a fake reddit API. Add this site to your praw.ini file:\n")
+    print("[fake]")
+    print("client_id=fake\nclient_secret=fake\nusername=fake\npassword=fake")
+    print("oauth_url={0}\nreddit_url={0}\nshort_url={0}\n".format(url))
+    print("and run the commands with --site fake.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Goodbye!")
+    finally:
+        server.server_close()
@@ -1,18 +1,586 @@
 """prawtools.helpers provides functions useful in other prawtools modules."""
+import atexit
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from optparse import OptionGroup, OptionParser
 
+import requests
+from praw import Reddit
+from prawcore.exceptions import RequestException, ServerError
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from six.moves.urllib.parse import urlencode, urlsplit
 from update_checker import update_check
 
 from . import __version__
 
-
 AGENT = "prawtools/{}".format(__version__)
+CACHE_TTLS = (  # (URL path pattern, seconds) pairs; the first match applies
+    (r"/api/v1/me$", 3600),
+    (r"/r/\w+/about/log/?$", 0),  # The moderation log has its own index
+    (r"/r/\w+/about/\w+/?$", 600),  # Moderators, contributors and other lists
+    (r"/r/\w+/api/flairlist/?$", 600),
+    (r"/r/\w+/api/(?:link|user)_flair_v2$", 600),
+    (r"/r/\w+/top/?$", 1800),
+    (r"/comments/\w+/?$", 1800),  # Comment trees
+)
+DEFAULT_CACHE_SIZE = 256  # The default cache size limit in MiB
+DEFAULT_POOL_SIZE = 4
+DEFAULT_TIMEOUT = 16
+
+
+class Journal(object):
+    """Record completed items in a file so that an interrupted run can resume.
+
+    The journal is a file containing one JSON encoded item per line. When no
+    path is provided nothing is recorded.
+
+    """
+
+    def __init__(self, path=None):
+        """Initialize the Journal, loading items recorded by previous runs."""
+        self.done = set()
+        self.path = path
+        self._fp = None
+        if not path:
+            return
+        if os.path.exists(path):
+            with open(path) as fp:
+                for line in fp:
+                    try:
+                        self.done.add(json.loads(line))
+                    except ValueError:
+                        pass  # A partially written line from an interrupted run
+        self._fp = open(path, "a")
+
+    def __contains__(self, item):
+        """Return True if `item` was recorded as completed."""
+        return item in self.done
+
+    def close(self):
+        """Close the journal file."""
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+
+    def record(self, item):
+        """Record `item` as completed."""
+        self.done.add(item)
+        if self._fp:
+            self._fp.write(json.dumps(item))
+            self._fp.write("\n")
+            self._fp.flush()
+
+
+class Progress(object):
+    """Track the progress, throughput and remaining time of a bulk operation."""
+
+    def __init__(self, total):
+        """Initialize the Progress instance for `total` items."""
+        self.completed = 0
+        self.started = time.time()
+        self.total = total
+
+    def __str__(self):
+        """Return a summary such as ``3/10, 1.50/s, ETA 0:00:05``."""
+        elapsed = time.time() - self.started
+        rate = self.completed / elapsed if elapsed > 0 else 0.0
+        if rate:
+            eta = int(round((self.total - self.completed) / rate))
+            eta = "{}:{:02}:{:02}".format(eta // 3600, eta // 60 % 60, eta % 60)
+        else:
+            eta = "unknown"
+        return "{}/{}, {:.2f}/s, ETA {}".format(self.completed, self.total, rate, eta)
+
+    def update(self, count=1):
+        """Record that `count` more items were completed."""
+        self.completed += count
+
+
+class TunedSession(requests.Session):
+    """A requests Session tuned for many concurrent requests to reddit.
+
+    Connections are kept alive in a pool holding up to `pool_size` connections
+    per host, so that as many concurrent workers can each reuse a connection
+    rather than opening a new one per request. Responses are requested gzip
+    compressed, and every request uses the same timeout. GET requests are
+    answered from `cache` when possible, and any other request to a subreddit
+    evicts the responses cached for that subreddit.
+
+    """
+
+    def __init__(
+        self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, cache=None
+    ):
+        """Initialize the TunedSession.
+
+        :param pool_size: The number of connections kept alive per host.
+            Should match the number of concurrent workers.
+        :param timeout: The number of seconds to wait for a response.
+        :param cache: When provided, the :class:`.ResponseCache` to use.
+
+        """
+        super(TunedSession, self).__init__()
+        self.cache = cache
+        self._local = threading.local()
+        self.timeout = timeout
+        self.headers["Accept-Encoding"] = "gzip"
+        self.headers["Connection"] = "keep-alive"
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def connection_stats(self):
+        """Return a list of (host, connections, requests) tuples.
+
+        `connections` is the number of connections opened to the host, and
+        `requests` the number of requests sent over them; every request beyond
+        the first one on each connection reused a kept-alive connection.
+
+        """
+        stats = {}
+        for adapter in set(self.adapters.values()):
+            manager = getattr(adapter, "poolmanager", None)
+            if manager is None:
+                continue
+            for key in manager.pools.keys():
+                pool = manager.pools[key]
+                connections, requests_ = stats.get(pool.host, (0, 0))
+                stats[pool.host] = (
+                    connections + pool.num_connections,
+                    requests_ + pool.num_requests,
+                )
+        return sorted((host,) + counts for host, counts in stats.items())
+
+    def _request(self, method, url, params, **kwargs):
+        kwargs["timeout"] = self.timeout
+        send = super(TunedSession, self).request
+        if self.cache and method.upper() != "GET":
+            try:
+                return send(method, url, params=params, **kwargs)
+            finally:  # Even a failed request may have changed something
+                self.cache.invalidate(url)
+        ttl = self.cache.ttl(url) if self.cache else 0
+        if not ttl:
+            return send(method, url, params=params, **kwargs)
+
+        key = self.cache.key(url, params)
+        if getattr(self._local, "uncached", False):
+            cached, fresh = None, False
+        else:
+            cached, fresh = self.cache.get(key, ttl)
+        if fresh:
+            self.cache.hits += 1
+            return cached
+        if cached is not None:
+            headers = dict(kwargs.get("headers") or {})
+            if "ETag" in cached.headers:
+                headers["If-None-Match"] = cached.headers["ETag"]
+            if "Last-Modified" in cached.headers:
+                headers["If-Modified-Since"] = cached.headers["Last-Modified"]
+            kwargs["headers"] = headers
+        response = send(method, url, params=params, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self.cache.refresh(key)
+            self.cache.revalidations += 1
+            return cached
+        self.cache.misses += 1
+        if response.status_code == 200:
+            self.cache.put(key, response)
+        return response
+
+    @contextmanager
+    def uncached(self):
+        """Send the GET requests made within, by this thread, to reddit.
+
+        Their responses still replace those in the cache.
+
+        """
+        self._local.uncached = True
+        try:
+            yield
+        finally:
+            self._local.uncached = False
+
+    def request(self, method, url, params=None, **kwargs):
+        """Issue a request using the session's timeout and cache.
+
+        Each request is recorded as a span when tracing is enabled.
+
+        """
+        if not tracer.enabled:
+            return self._request(method, url, params, **kwargs)
+        with tracer.span("{} {}".format(method.upper(), urlsplit(url).path)) as span:
+            response = self._request(method, url, params, **kwargs)
+            span.set(status=response.status_code)
+            return response
+
+
+class ResponseCache(object):
+    """Store GET responses on disk so that repeated requests are served locally.
+
+    Each response is kept for the time to live of the first pattern in `ttls`
+    matching its URL path; responses to other URLs are not stored. A stale
+    response that carries an ETag or Last-Modified header is revalidated with
+    a conditional request rather than fetched again. When the stored responses
+    exceed `max_size` bytes the least recently used ones are evicted.
+
+    The cache is keyed by URL only, so a cache file must not be shared between
+    accounts that can see different data.
+
+    """
+
+    dropped_headers = {
+        "content-encoding",
+        "content-length",
+        "transfer-encoding",
+        "x-ratelimit-remaining",
+        "x-ratelimit-reset",
+        "x-ratelimit-used",
+    }
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE * 2**20, ttls=CACHE_TTLS):
+        """Initialize the ResponseCache, creating the database when needed.
+
+        :param path: The path to the SQLite database holding the responses.
+        :param max_size: The maximum total size of the stored responses.
+        :param ttls: A sequence of (pattern, seconds) pairs.
+
+        """
+        self.evictions = self.hits = self.misses = self.revalidations = 0
+        self.max_size = max_size
+        self.ttls = [(re.compile(pattern), seconds) for pattern, seconds in ttls]
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=60
+        )
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS response (
+                key TEXT PRIMARY KEY,
+                stored REAL NOT NULL,
+                used REAL NOT NULL,
+                size INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS response_used ON response (used);
+        """)
+        self.size = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM response"
+        ).fetchone()[0]
+
+    def __str__(self):
+        """Return a summary of the cache counters."""
+        return (
+            "{} hits, {} revalidated, {} misses, {} evictions, {:.1f} MiB stored"
+        ).format(
+            self.hits,
+            self.revalidations,
+            self.misses,
+            self.evictions,
+            self.size / 2.0**20,
+        )
+
+    def _evict(self):
+        rows = self.db.execute("SELECT key, size FROM response ORDER BY used")
+        evicted = []
+        for key, size in rows:
+            if self.size <= self.max_size:
+                break
+            evicted.append((key,))
+            self.size -= size
+        self.db.executemany("DELETE FROM response WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    @staticmethod
+    def key(url, params=None):
+        """Return the cache key of a request for `url` with `params`."""
+        if params:
+            url += "?" + urlencode(sorted(params.items()))
+        return url
+
+    def close(self):
+        """Close the database."""
+        self.db.close()
+
+    def get(self, key, ttl):
+        """Return a tuple (response, fresh) for the response stored under `key`.
+
+        `response` is None when nothing is stored, and `fresh` is True when it
+        was stored within the last `ttl` seconds.
+
+        """
+        with self._lock:
+            row = self.db.execute(
+                "SELECT stored, headers, body FROM response WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None, False
+            now = time.time()
+            self.db.execute("UPDATE response SET used = ? WHERE key = ?", (now, key))
+        response = requests.Response()
+        response._content = bytes(row[2])
+        response.headers = CaseInsensitiveDict(json.loads(row[1]))
+        response.status_code = 200
+        response.url = key
+        return response, row[0] + ttl > now
+
+    def put(self, key, response):
+        """Store the successful `response` under `key`."""
+        headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in self.dropped_headers
+        }
+        body = response.content
+        now = time.time()
+        with self._lock:
+            previous = self.db.execute(
+                "SELECT size FROM response WHERE key = ?", (key,)
+            ).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?, ?)",
+                (key, now, now, len(body), json.dumps(headers), sqlite3.Binary(body)),
+            )
+            self.size += len(body) - (previous[0] if previous else 0)
+            if self.size > self.max_size:
+                self._evict()
+
+    def invalidate(self, url):
+        """Remove the responses stored for the subreddit `url` refers to.
+
+        Nothing is removed when `url` does not refer to a subreddit.
+
+        """
+        parts = urlsplit(url)
+        match = re.match(r"/r/[^/]+/", parts.path)
+        if not match:
+            return
+        prefix = "{}://{}{}".format(parts.scheme, parts.netloc, match.group())
+        query = "FROM response WHERE substr(key, 1, ?) = ?"
+        with self._lock:
+            size = self.db.execute(
+                "SELECT COALESCE(SUM(size), 0) " + query, (len(prefix), prefix)
+            ).fetchone()[0]
+            self.db.execute("DELETE " + query, (len(prefix), prefix))
+            self.size -= size
+
+    def refresh(self, key):
+        """Mark the response stored under `key` as fresh again."""
+        with self._lock:
+            self.db.execute(
+                "UPDATE response SET stored = ? WHERE key = ?", (time.time(), key)
+            )
+
+    def ttl(self, url):
+        """Return the number of seconds responses for `url` may be reused."""
+        path = urlsplit(url).path
+        for pattern, seconds in self.ttls:
+            if pattern.search(path):
+                return seconds
+        return 0
+
+
+class ThreadLocalOutput(object):
+    """A file-like object that writes to a per-thread stream.
+
+    Installed as ``sys.stdout`` it allows the output of code running in
+    different threads to be collected separately. Threads without a stream of
+    their own write to the default stream.
+
+    """
+
+    def __init__(self, default):
+        """Initialize the ThreadLocalOutput with the `default` stream."""
+        self.default = default
+        self._local = threading.local()
+
+    def __getattr__(self, attribute):
+        """Forward other attributes to the current stream."""
+        return getattr(self.stream, attribute)
+
+    @property
+    def stream(self):
+        """Return the stream of the current thread."""
+        return getattr(self._local, "stream", None) or self.default
+
+    def flush(self):
+        """Flush the current stream."""
+        self.stream.flush()
+
+    @contextmanager
+    def redirect(self, stream):
+        """Send output from the current thread to `stream` within the context."""
+        previous = getattr(self._local, "stream", None)
+        self._local.stream = stream
+        try:
+            yield stream
+        finally:
+            self._local.stream = previous
+
+    def write(self, data):
+        """Write `data` to the current stream."""
+        return self.stream.write(data)
+
+
+class NullSpan(object):
+    """A span that records nothing, used while tracing is disabled."""
+
+    def __enter__(self):
+        """Return the span."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Do nothing."""
+
+    def set(self, **args):
+        """Do nothing."""
+
+
+class Span(object):
+    """A span of a :class:`.Tracer` that is recorded when its context exits."""
+
+    def __init__(self, tracer, name, args):
+        """Initialize the Span with a `name` and a dictionary of `args`."""
+        self.args = args
+        self.name = name
+        self.start = None
+        self.tracer = tracer
+
+    def __enter__(self):
+        """Start the span."""
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Record the span, noting the exception that ended it if any."""
+        if exc_type is not None:
+            self.args["error"] = repr(exc_value)
+        self.tracer.record(self.name, self.start, time.time() - self.start, self.args)
+
+    def set(self, **args):
+        """Add `args` to the arguments recorded with the span."""
+        self.args.update(args)
+
+
+class Tracer(object):
+    """Record spans to a file in the Chrome trace event format.
+
+    The file can be opened with trace viewers such as chrome://tracing or
+    https://ui.perfetto.dev. Events are written as they complete, so the trace
+    of an interrupted run remains readable. While no file is open, spans are
+    :class:`.NullSpan` instances and cost a single method call.
+
+    """
+
+    def __init__(self):
+        """Initialize the Tracer in the disabled state."""
+        self.enabled = False
+        self._fp = None
+        self._lock = threading.Lock()
+        self._threads = set()
+
+    def _write(self, event):
+        self._fp.write(json.dumps(event, sort_keys=True))
+        self._fp.write(",\n")
+
+    def close(self):
+        """Finish the trace file and disable tracing."""
+        with self._lock:
+            if not self._fp:
+                return
+            self.enabled = False
+            self._fp.write("{}\n]\n")
+            self._fp.close()
+            self._fp = None
+
+    def complete(self, name, duration, **args):
+        """Record a span of `duration` seconds that ends now."""
+        if self.enabled:
+            self.record(name, time.time() - duration, duration, args)
+
+    def open(self, path):
+        """Start recording spans to the file at `path`."""
+        self.close()
+        with self._lock:
+            self._fp = open(path, "w")
+            self._fp.write("[\n")
+            self._threads = set()
+            self.enabled = True
+        atexit.register(self.close)
+
+    def record(self, name, start, duration, args):
+        """Record a span that started at `start` and lasted `duration` seconds."""
+        thread = threading.current_thread()
+        event = {
+            "args": args,
+            "dur": int(duration * 1e6),
+            "name": name,
+            "ph": "X",
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "ts": int(start * 1e6),
+        }
+        with self._lock:
+            if not self._fp:
+                return
+            if thread.ident not in self._threads:
+                self._threads.add(thread.ident)
+                self._write(
+                    {
+                        "args": {"name": thread.name},
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": event["pid"],
+                        "tid": thread.ident,
+                    }
+                )
+            self._write(event)
+            self._fp.flush()
+
+    def span(self, name, **args):
+        """Return a context manager recording a span named `name`.
+
+        :param args: Values recorded with the span. More can be added through
+            the ``set`` method of the returned span.
+
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+
+NULL_SPAN = NullSpan()
+tracer = Tracer()  # The tracer shared by all prawtools modules
 
 
 def arg_parser(*args, **kwargs):
     """Return a parser with common options used in the prawtools commands."""
     msg = {
+        "cache": (
+            "Store responses that rarely change, such as flair and moderator "
+            "lists, top listings and comment trees, in the database CACHE and "
+            "reuse them for a while in subsequent runs."
+        ),
+        "cache_size": (
+            "The maximum size of the response cache in MiB [default: %default]."
+        ),
         "site": "The site to connect to defined in your praw.ini file.",
+        "timeout": (
+            "The number of seconds to wait for each response from reddit "
+            "[default: %default]."
+        ),
+        "trace": (
+            "Record the duration of requests and processing steps to FILE in "
+            "the Chrome trace event format."
+        ),
         "update": "Prevent the checking for prawtools package updates.",
     }
 
@@ -28,14 +596,196 @@ def arg_parser(*args, **kwargs):
     parser.add_option(
         "-U", "--disable-update-check", action="store_true", help=msg["update"]
     )
+    parser.add_option("--trace", metavar="FILE", help=msg["trace"])
 
     group = OptionGroup(parser, "Site/Authentication options")
     group.add_option("-S", "--site", help=msg["site"])
+    group.add_option(
+        "--timeout",
+        type="float",
+        default=DEFAULT_TIMEOUT,
+        metavar="SECONDS",
+        help=msg["timeout"],
+    )
+    group.add_option("--cache", help=msg["cache"])
+    group.add_option(
+        "--cache-size",
+        type="int",
+        default=DEFAULT_CACHE_SIZE,
+        metavar="MIB",
+        help=msg["cache_size"],
+    )
     parser.add_option_group(group)
 
     return parser
 
 
+def chunks(iterable, size):
+    """Yield lists containing up to `size` consecutive items of `iterable`."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def connection_summary(reddit):
+    """Return lines describing the connection reuse and cache use of `reddit`.
+
+    There is a line per host, followed by one for the response cache when it
+    is used. Returns an empty list when `reddit` was not created by
+    :func:`.create_reddit`.
+
+    """
+    session = reddit._core._requestor._http
+    if not isinstance(session, TunedSession):
+        return []
+    lines = [
+        "{}: {} requests over {} connections".format(host, requests_, connections)
+        for host, connections, requests_ in session.connection_stats()
+    ]
+    if session.cache:
+        lines.append("Response cache: {}".format(session.cache))
+    return lines
+
+
+def create_reddit(
+    site=None,
+    pool_size=DEFAULT_POOL_SIZE,
+    timeout=DEFAULT_TIMEOUT,
+    cache=None,
+    cache_size=DEFAULT_CACHE_SIZE,
+):
+    """Return a :class:`praw.Reddit` instance using a :class:`.TunedSession`.
+
+    :param site: The site to connect to defined in the praw.ini file.
+    :param pool_size: The number of connections kept alive per host. Should
+        match the number of threads sharing the instance.
+    :param timeout: The number of seconds to wait for each response.
+    :param cache: When provided, the path to a :class:`.ResponseCache`
+        database to serve repeated requests from.
+    :param cache_size: The maximum size of the response cache in MiB.
+
+    """
+    if cache:
+        cache = ResponseCache(cache, cache_size * 2**20)
+    return Reddit(
+        site,
+        check_for_updates=False,
+        requestor_kwargs={"session": TunedSession(pool_size, timeout, cache)},
+        user_agent=AGENT,
+    )
+
+
+def ratelimit_delay(message, default=60):
+    """Return the number of seconds to wait given a RATELIMIT error message.
+
+    reddit's message looks like "you are doing that too much. try again in 5
+    minutes."
+
+    """
+    match = re.search(r"(\d+) (millisecond|second|minute)", message or "")
+    if not match:
+        return default
+    value, unit = int(match.group(1)), match.group(2)
+    return {"millisecond": value / 1000.0, "minute": value * 60}.get(unit, value) + 1
+
+
+def retry(function, args=(), attempts=3, delay=1):
+    """Return the result of calling `function`, retrying on transient errors.
+
+    :param function: The function to call.
+    :param args: The positional arguments to call `function` with.
+    :param attempts: The maximum number of calls to make.
+    :param delay: The number of seconds to wait before the first retry. The
+        delay doubles with each subsequent retry.
+
+    """
+    for i in range(attempts):
+        try:
+            return function(*args)
+        except (RequestException, ServerError):
+            if i >= attempts - 1:
+                raise
+            time.sleep(delay * 2**i)
+
+
+def run_concurrently(function, items, workers=4, reddit=None, attempts=3):
+    """Call `function` for each item using a bounded number of threads.
+
+    Each call is retried on transient errors via :func:`.retry`.
+
+    :param function: The function to call with each item.
+    :param items: An iterable of items.
+    :param workers: The maximum number of concurrent calls.
+    :param reddit: When provided, new calls are held back while the remaining
+        rate limit of this :class:`praw.Reddit` instance does not cover the
+        calls in flight.
+    :param attempts: The maximum number of calls per item. Use 1 for calls
+        that must not be repeated, such as sending a message, as a transient
+        error does not prove that reddit did not act on the request.
+    :returns: A generator of (item, result, error) tuples in completion order,
+        where error is the exception raised by the final attempt, or None.
+
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+        while True:
+            for item in items:
+                if reddit is not None:
+                    wait_for_rate_limit(reddit, len(in_flight) + 1)
+                future = executor.submit(retry, function, (item,), attempts)
+                in_flight[future] = item
+                if len(in_flight) >= workers:
+                    break
+            if not in_flight:
+                return
+            completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in completed:
+                item = in_flight.pop(future)
+                error = future.exception()
+                yield item, None if error else future.result(), error
+
+
+def traced(function):
+    """Decorate `function` so that each call is recorded as a span."""
+
+    @functools.wraps(function)
+    def wrapped(*args, **kwargs):
+        with tracer.span(function.__name__):
+            return function(*args, **kwargs)
+
+    return wrapped
+
+
+@contextmanager
+def uncached(reddit):
+    """Bypass the response cache of `reddit` for the requests made within.
+
+    Use this for reads that decide what to write, which must reflect the
+    current state on reddit rather than a cached one.
+
+    """
+    session = reddit._core._requestor._http
+    if not isinstance(session, TunedSession) or not session.cache:
+        yield
+        return
+    with session.uncached():
+        yield
+
+
+def wait_for_rate_limit(reddit, needed=1):
+    """Sleep until the rate limit of `reddit` allows `needed` more requests."""
+    limits = reddit.auth.limits
+    remaining, reset = limits.get("remaining"), limits.get("reset_timestamp")
+    if remaining is not None and reset and remaining < needed:
+        time.sleep(max(0, reset - time.time()))
+
+
 def check_for_updates(options):
     """Check for package updates."""
     if not options.disable_update_check:  # Check for updates
@@ -4,66 +4,688 @@ This command allows you to view and change some subreddit options.
 
 """
 from __future__ import print_function
+import atexit
+import csv
+import hashlib
+import heapq
+import io
 import json
+import os
 import re
+import sqlite3
 import sys
+import tempfile
+import time
 from collections import Counter
+from datetime import datetime
 from optparse import OptionGroup
 
-from praw import Reddit
+from praw.exceptions import APIException
 from six.moves import input
 
-from .helpers import AGENT, arg_parser, check_for_updates
+from .helpers import (
+    Journal,
+    Progress,
+    ThreadLocalOutput,
+    arg_parser,
+    check_for_updates,
+    chunks,
+    connection_summary,
+    create_reddit,
+    ratelimit_delay,
+    retry,
+    run_concurrently,
+    traced,
+    tracer,
+    uncached,
+)
+
+DEFAULT_WORKERS = 4  # The default number of concurrent requests
+FLAIR_BATCH_SIZE = 100  # The maximum number of users per flaircsv request
+MESSAGE_ATTEMPTS = 5  # The number of times to try sending a rate limited message
+SORT_CHUNK_SIZE = 100000  # The number of items sorted in memory at a time
+
+
+def external_sort(items, key=None, chunk_size=SORT_CHUNK_SIZE):
+    """Generate `items` in sorted order using a bounded amount of memory.
+
+    Sorted runs of up to `chunk_size` items are spilled to temporary files as
+    JSON lines and then merged, so items must be JSON serializable. Lists are
+    yielded as tuples.
+
+    """
+    runs = []
+    try:
+        for chunk in chunks(items, chunk_size):
+            chunk.sort(key=key)
+            run = tempfile.TemporaryFile("w+")
+            for item in chunk:
+                run.write(json.dumps(item))
+                run.write("\n")
+            run.seek(0)
+            runs.append(run)
+        readers = [(tuple(json.loads(line)) for line in run) for run in runs]
+        for item in heapq.merge(*readers, key=key):
+            yield item
+    finally:
+        for run in runs:
+            run.close()
+
+
+def journal_key(operation, category, user, digest=None):
+    """Return the journal entry recording `operation` for `user`.
+
+    :param digest: When provided, identifies what `operation` was done with,
+        e.g., the :func:`message_digest` of a message.
+
+    """
+    if digest:
+        return "{}/{}/{}/{}".format(operation, category, digest, user)
+    return "{}/{}/{}".format(operation, category, user)
+
+
+def load_flair_file(path):
+    """Return a list of flair dictionaries read from a CSV or JSON file.
+
+    JSON files contain a list of objects with the keys ``user``,
+    ``flair_text`` and ``flair_css_class``, as output by ``--flair --json``.
+    Any other file is read as CSV with the columns user, text and css class.
+
+    """
+    with io.open(path, encoding="utf-8", newline="") as fp:
+        if path.lower().endswith(".json"):
+            rows = [
+                (item["user"], item.get("flair_text"), item.get("flair_css_class"))
+                for item in json.load(fp)
+            ]
+        else:
+            rows = [row + [""] * (3 - len(row)) for row in csv.reader(fp) if row]
+    return [
+        {"flair_css_class": css or "", "flair_text": text or "", "user": user}
+        for user, text, css in rows
+    ]
+
+
+def message_digest(subject, body):
+    """Return a short digest identifying a message by its subject and body."""
+    text = "{}\n{}".format(subject, body).encode("utf-8")
+    return hashlib.sha1(text).hexdigest()[:12]
+
+
+def template_changes(existing, desired):
+    """Return the changes needed to turn `existing` templates into `desired`.
+
+    New templates can only be appended, so existing templates are either kept,
+    updated in place, or deleted such that the fewest requests are needed to
+    obtain the desired order.
+
+    :param existing: A list of template dictionaries as returned by reddit.
+    :param desired: An ordered list of (text, css_class, text_editable) tuples.
+    :returns: A list of (action, template_id, template) tuples where action is
+        one of ``update``, ``delete`` or ``add``. Updates and deletions come
+        before additions.
+
+    """
+
+    def key(template):
+        return (
+            template.get("text", template.get("flair_text")) or "",
+            template.get("css_class", template.get("flair_css_class")) or "",
+            bool(template.get("text_editable", template.get("flair_text_editable"))),
+        )
+
+    current = [key(template) for template in existing]
+    ids = [x.get("id", x.get("flair_template_id")) for x in existing]
+
+    # cost[i][j]: requests to turn existing[:i] into desired[:j] without adding
+    infinity = float("inf")
+    cost = [[infinity] * (len(desired) + 1) for _ in range(len(current) + 1)]
+    cost[0][0] = 0
+    for i in range(1, len(current) + 1):
+        cost[i][0] = i
+        for j in range(1, len(desired) + 1):
+            cost[i][j] = min(
+                cost[i - 1][j] + 1,  # Delete existing[i - 1]
+                cost[i - 1][j - 1] + (current[i - 1] != desired[j - 1]),
+            )
+    last = cost[len(current)]
+    kept = min(range(len(desired) + 1), key=lambda j: (last[j] + len(desired) - j, -j))
+
+    changes = []
+    i, j = len(current), kept
+    while i > 0:
+        if j > 0 and cost[i][j] == cost[i - 1][j - 1] + (
+            current[i - 1] != desired[j - 1]
+        ):
+            if current[i - 1] != desired[j - 1]:
+                changes.append(("update", ids[i - 1], desired[j - 1]))
+            j -= 1
+        else:
+            changes.append(("delete", ids[i - 1], None))
+        i -= 1
+    changes.reverse()
+    changes.extend(("add", None, template) for template in desired[kept:])
+    return changes
+
+
+class FlairSnapshot(object):
+    """Persist the flair list of a subreddit to disk.
+
+    The snapshot is stored as JSON lines: a header object containing the
+    subreddit and the time of the snapshot, followed by one ``[user, text,
+    css]`` list per flaired user, sorted by user. Snapshots are read and
+    written incrementally so that memory usage does not depend on their size.
+
+    """
+
+    def __init__(self, path, ttl=3600):
+        """Initialize the FlairSnapshot.
+
+        :param path: The file in which the snapshot is stored.
+        :param ttl: The number of seconds the snapshot may be reused for.
+
+        """
+        self.path = path
+        self.ttl = ttl
+
+    @staticmethod
+    def diff(old, new):
+        """Generate the differences between two flair listings.
+
+        :param old: An iterable of (user, text, css) tuples sorted by user.
+        :param new: An iterable of (user, text, css) tuples sorted by user.
+        :returns: A generator of (user, old, new) tuples, in user order, where
+            old and new are (text, css) tuples, or None when the user has no
+            flair in the respective listing.
+
+        """
+        old, new = iter(old), iter(new)
+        before, after = next(old, None), next(new, None)
+        while before is not None or after is not None:
+            if after is None or (before is not None and before[0] < after[0]):
+                yield before[0], tuple(before[1:]), None
+                before = next(old, None)
+            elif before is None or after[0] < before[0]:
+                yield after[0], None, tuple(after[1:])
+                after = next(new, None)
+            else:
+                if before[1:] != after[1:]:
+                    yield before[0], tuple(before[1:]), tuple(after[1:])
+                before, after = next(old, None), next(new, None)
+
+    def entries(self):
+        """Generate the (user, text, css) tuples of the snapshot."""
+        with open(self.path) as fp:
+            fp.readline()  # Skip the header
+            for line in fp:
+                yield tuple(json.loads(line))
+
+    def header(self, subreddit):
+        """Return the header of the snapshot if it is for `subreddit`.
+
+        :returns: None if there is no such snapshot, otherwise a dictionary
+            containing the subreddit and the timestamp of the snapshot.
+
+        """
+        try:
+            with open(self.path) as fp:
+                header = json.loads(fp.readline())
+            header["timestamp"]
+        except (IOError, KeyError, TypeError, ValueError):
+            return None
+        if header.get("subreddit", "").lower() != subreddit.lower():
+            return None
+        return header
+
+    def is_fresh(self, subreddit):
+        """Return True if the snapshot is for `subreddit` and within its ttl."""
+        header = self.header(subreddit)
+        return bool(header) and time.time() - header["timestamp"] <= self.ttl
+
+    def remove(self):
+        """Remove the snapshot so that the flair list is fetched again."""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def save(self, subreddit, flair, presorted=False):
+        """Atomically replace the snapshot.
+
+        :param subreddit: The name of the subreddit.
+        :param flair: An iterable of (user, text, css) tuples.
+        :param presorted: When True, `flair` is already sorted by user.
+
+        """
+        if not presorted:
+            flair = external_sort(flair, key=lambda x: x[0])
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as fp:
+            fp.write(json.dumps({"subreddit": subreddit, "timestamp": time.time()}))
+            fp.write("\n")
+            for item in flair:
+                fp.write(json.dumps(list(item)))
+                fp.write("\n")
+        os.rename(tmp_path, self.path)
+
+
+class ModLogIndex(object):
+    """Store moderation log entries in a local SQLite database.
+
+    Entries of many subreddits can be stored in the same database. Entries are
+    ingested incrementally, and aggregate queries are answered locally.
+
+    """
+
+    columns = (
+        "id",
+        "subreddit",
+        "created_utc",
+        "moderator",
+        "action",
+        "target_author",
+        "target_fullname",
+        "details",
+        "description",
+    )
+    groups = {
+        "action": "action",
+        "day": "strftime('%Y-%m-%d', created_utc, 'unixepoch')",
+        "moderator": "moderator",
+        "month": "strftime('%Y-%m', created_utc, 'unixepoch')",
+        "week": "strftime('%Y-W%W', created_utc, 'unixepoch')",
+    }
+
+    def __init__(self, path):
+        """Initialize the ModLogIndex, creating the database when needed."""
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS modlog (
+                id TEXT PRIMARY KEY,
+                subreddit TEXT NOT NULL,
+                created_utc REAL NOT NULL,
+                moderator TEXT,
+                action TEXT,
+                target_author TEXT,
+                target_fullname TEXT,
+                details TEXT,
+                description TEXT
+            );
+            CREATE INDEX IF NOT EXISTS modlog_created
+                ON modlog (subreddit, created_utc);
+            CREATE INDEX IF NOT EXISTS modlog_moderator
+                ON modlog (subreddit, moderator, created_utc);
+            CREATE INDEX IF NOT EXISTS modlog_action
+                ON modlog (subreddit, action, created_utc);
+            CREATE TABLE IF NOT EXISTS cursor (
+                subreddit TEXT PRIMARY KEY,
+                id TEXT NOT NULL,
+                created_utc REAL NOT NULL
+            );
+            """)
+
+    def close(self):
+        """Close the database."""
+        self.db.close()
+
+    def ingest(self, subreddit, actions, batch_size=500):
+        """Store the moderation log entries newer than the stored cursor.
+
+        The cursor is only advanced once all new entries have been stored, so
+        an interrupted ingestion is completed by the next one.
+
+        :param subreddit: The name of the subreddit.
+        :param actions: An iterable of ModAction instances, newest first.
+        :param batch_size: The number of entries to store per transaction.
+        :returns: The number of entries stored.
+
+        """
+        subreddit = subreddit.lower()
+        cursor = self.db.execute(
+            "SELECT id, created_utc FROM cursor WHERE subreddit = ?", (subreddit,)
+        ).fetchone()
+        insert = "INSERT OR IGNORE INTO modlog ({}) VALUES ({})".format(
+            ", ".join(self.columns), ", ".join("?" * len(self.columns))
+        )
+
+        def rows():
+            for action in actions:
+                if cursor and (
+                    action.id == cursor[0] or action.created_utc < cursor[1]
+                ):
+                    return
+                yield (
+                    action.id,
+                    subreddit,
+                    action.created_utc,
+                    str(action.mod) if action.mod else None,
+                    action.action,
+                    action.target_author or None,
+                    action.target_fullname,
+                    action.details,
+                    action.description,
+                )
+
+        count, newest = 0, None
+        for batch in chunks(rows(), batch_size):
+            newest = newest or batch[0]
+            with self.db:
+                self.db.executemany(insert, batch)
+            count += len(batch)
+        if newest:
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO cursor VALUES (?, ?, ?)",
+                    (subreddit, newest[0], newest[2]),
+                )
+        return count
+
+    def report(self, subreddit, group, since=None, action=None, moderator=None):
+        """Return the number of entries per `group`.
+
+        :param subreddit: The name of the subreddit.
+        :param group: One of ``action``, ``day``, ``moderator``, ``month``, or
+            ``week``.
+        :param since: When provided, only count entries created at, or after,
+            this timestamp.
+        :param action: When provided, only count entries of this action.
+        :param moderator: When provided, only count entries of this moderator.
+        :returns: A list of (group, count) tuples. Time groups are ordered
+            chronologically, other groups by decreasing count.
+
+        """
+        conditions, parameters = ["subreddit = ?"], [subreddit.lower()]
+        for column, value in (("action", action), ("moderator", moderator)):
+            if value:
+                conditions.append("{} = ?".format(column))
+                parameters.append(value)
+        if since is not None:
+            conditions.append("created_utc >= ?")
+            parameters.append(since)
+        if group in ("action", "moderator"):
+            order = "count DESC, key"
+        else:
+            order = "key"
+        query = (
+            "SELECT {} AS key, COUNT(*) AS count FROM modlog WHERE {} "
+            "GROUP BY key ORDER BY {}"
+        ).format(self.groups[group], " AND ".join(conditions), order)
+        return self.db.execute(query, parameters).fetchall()
 
 
 class ModUtils(object):
     """Class that provides all the modutils functionality."""
 
-    def __init__(self, subreddit, site=None, verbose=None):
-        """Initialize the ModUtils class by passing in config options."""
-        self.reddit = Reddit(site, check_for_updates=False, user_agent=AGENT)
+    def __init__(self, subreddit, site=None, verbose=None, snapshot=None, reddit=None):
+        """Initialize the ModUtils class by passing in config options.
+
+        :param snapshot: When provided, a :class:`.FlairSnapshot` used to reuse
+            the flair list between runs.
+        :param reddit: When provided, the :class:`praw.Reddit` instance to use
+            instead of creating one, e.g., to share a session.
+
+        """
+        self.reddit = reddit or create_reddit(site)
         self.sub = self.reddit.subreddit(subreddit)
+        self.snapshot = snapshot
         self.verbose = verbose
-        self._current_flair = None
-
-    def add_users(self, category):
-        """Add users to 'banned', 'contributor', or 'moderator'."""
-        mapping = {
-            "banned": "ban",
-            "contributor": "make_contributor",
-            "moderator": "make_moderator",
+        self._flair_cache = None
+
+    @staticmethod
+    def _flair_row(flair):
+        """Return `flair` with its quotes escaped for praw's flair CSV.
+
+        praw quotes each value of the CSV it sends without escaping the quotes
+        within, so they are doubled here.
+
+        """
+        return {
+            "flair_css_class": (flair.get("flair_css_class") or "").replace('"', '""'),
+            "flair_text": (flair.get("flair_text") or "").replace('"', '""'),
+            "user": flair["user"],
         }
 
-        if category not in mapping:
+    @staticmethod
+    def _flair_tuple(flair):
+        return str(flair["user"]), flair["flair_text"], flair["flair_css_class"]
+
+    @staticmethod
+    def _temporary_snapshot():
+        descriptor, path = tempfile.mkstemp(".jsonl")
+        os.close(descriptor)
+        atexit.register(os.remove, path)
+        return FlairSnapshot(path)
+
+    def _cached_flair(self, fetch=True):
+        """Return the snapshot caching the flair list.
+
+        :param fetch: When True, fetch the flair list if it is not cached,
+            otherwise return None.
+
+        """
+        if self._flair_cache is None and self.snapshot:
+            if self.snapshot.is_fresh(self.sub.display_name):
+                if self.verbose:
+                    print("Using flair snapshot {}".format(self.snapshot.path))
+                self._flair_cache = self.snapshot
+        if self._flair_cache is None and fetch:
+            for _ in self._fetch_flair(self.snapshot):
+                pass
+        return self._flair_cache
+
+    def _fetch_flair(self, target=None):
+        """Generate the flair list from reddit while saving it to `target`.
+
+        The flair list is spooled to disk and saved, sorted by user, to `target`
+        (or a temporary snapshot) once it has been completely fetched.
+
+        """
+        target = target or self._temporary_snapshot()
+        if self.verbose:
+            print("Fetching flair list for {}".format(self.sub))
+        with tempfile.TemporaryFile("w+") as spool:
+            for flair in self.sub.flair(limit=None):
+                spool.write(json.dumps(self._flair_tuple(flair)))
+                spool.write("\n")
+                yield flair
+            spool.seek(0)
+            target.save(
+                self.sub.display_name, (tuple(json.loads(line)) for line in spool)
+            )
+        self._flair_cache = target
+
+    def _members(self, category):
+        """Generate all of the users in `category`."""
+        if category == "moderator":
+            return self.sub.moderator()  # Not paginated, and takes no limit
+        return getattr(self.sub, category)(limit=None)
+
+    @traced
+    def add_users(self, category, journal=None, workers=DEFAULT_WORKERS):
+        """Add users to 'banned', 'contributor', or 'moderator'.
+
+        Duplicate names and users already in `category` are skipped, and the
+        remaining users are added concurrently.
+
+        :param category: One of 'banned', 'contributor', or 'moderator'.
+        :param journal: When provided, the path of a file recording the users
+            that were added, so that an interrupted run can be resumed.
+        :param workers: The maximum number of concurrent requests.
+
+        """
+        if category not in ("banned", "contributor", "moderator"):
             print("{!r} is not a valid option for --add".format(category))
             return
-        func = getattr(self.sub, mapping[category])
         print("Enter user names (any separation should suffice):")
         data = sys.stdin.read().strip()
+        names, seen = [], set()
         for name in re.split("[^A-Za-z0-9_]+", data):
-            func(name)
-            print("Added {!r} to {}".format(name, category))
+            if name and name.lower() not in seen:
+                seen.add(name.lower())
+                names.append(name)
+
+        journal = Journal(journal)
+        if self.verbose:
+            print("Fetching {} users of {}".format(category, self.sub))
+        with uncached(self.reddit):
+            members = set(str(x).lower() for x in self._members(category))
+        pending = [
+            x
+            for x in names
+            if x.lower() not in members
+            and journal_key("add", category, x) not in journal
+        ]
+        if len(pending) < len(names):
+            print(
+                "Skipping {} users already in {}".format(
+                    len(names) - len(pending), category
+                )
+            )
+
+        relationship = getattr(self.sub, category)
+
+        def add(name):
+            with tracer.span("add user", user=name):
+                return relationship.add(name)
+
+        try:
+            for name, _, error in run_concurrently(add, pending, workers, self.reddit):
+                if error:
+                    print("Failed to add {!r} to {}: {}".format(name, category, error))
+                else:
+                    journal.record(journal_key("add", category, name))
+                    print("Added {!r} to {}".format(name, category))
+        finally:
+            journal.close()
+
+    @traced
+    def apply_flair(self, path):
+        """Set flair from a CSV or JSON file."""
+        try:
+            flair_list = load_flair_file(path)
+        except (IOError, KeyError, TypeError, ValueError) as error:
+            print("Invalid flair file {}: {}".format(path, error))
+            return
+        self.bulk_flair(flair_list)
+        self._flair_cache = None  # The cached flair list is now outdated
+        if self.snapshot:
+            self.snapshot.remove()
+
+    @traced
+    def bulk_flair(self, flair_list):
+        """Set the flair of many users, up to 100 users per request.
 
+        :param flair_list: An iterable of dictionaries with the keys ``user``,
+            ``flair_text`` and ``flair_css_class``.
+        :returns: A tuple containing the number of successful updates and the
+            list of users whose update failed.
+
+        """
+        successful, failed = 0, []
+        for batch in chunks(flair_list, FLAIR_BATCH_SIZE):
+            with tracer.span("flair batch", users=len(batch)):
+                rows = [self._flair_row(flair) for flair in batch]
+                results = retry(self.sub.flair.update, (rows,))
+            for flair, result in zip(batch, results):
+                if result.get("ok"):
+                    successful += 1
+                    if self.verbose:
+                        print(result.get("status"))
+                else:
+                    failed.append(flair["user"])
+                    print(
+                        "Failed to update flair for {}: {}".format(
+                            flair["user"], result.get("errors") or result.get("status")
+                        )
+                    )
+            print(
+                "Updated flair for {} users ({} failed)".format(successful, len(failed))
+            )
+        return successful, failed
+
+    @traced
     def clear_empty(self):
-        """Remove flair that is not visible or has been set to empty."""
-        for flair in self.current_flair():
-            if not flair["flair_text"] and not flair["flair_css_class"]:
-                print(self.reddit.flair.update(flair["user"]))
-                print("Removed flair for {0}".format(flair["user"]))
-
-    def current_flair(self):
-        """Generate the flair, by user, for the subreddit."""
-        if self._current_flair is None:
-            self._current_flair = []
-            if self.verbose:
-                print("Fetching flair list for {}".format(self.sub))
-            for flair in self.sub.flair:
-                self._current_flair.append(flair)
+        """Remove flair that is not visible or has been set to empty.
+
+        The flair list is always fetched, rather than taken from a snapshot, as
+        clearing flair set since the snapshot was taken would destroy it.
+
+        """
+        _, failed = self.bulk_flair(
+            {"flair_css_class": "", "flair_text": "", "user": str(flair["user"])}
+            for flair in self.current_flair(refresh=True)
+            if not flair["flair_text"] and not flair["flair_css_class"]
+        )
+        failed = set(failed)
+        cache = self._cached_flair()
+        cache.save(
+            self.sub.display_name,
+            (x for x in cache.entries() if x[1] or x[2] or x[0] in failed),
+            presorted=True,
+        )
+
+    def current_flair(self, refresh=False):
+        """Generate the flair, by user, for the subreddit.
+
+        The flair list is cached on disk, in the snapshot when one is used, so
+        that it is only fetched once.
+
+        :param refresh: Ignore any cached flair and fetch it from reddit.
+
+        """
+        if refresh or self._cached_flair(fetch=False) is None:
+            for flair in self._fetch_flair(self.snapshot):
                 yield flair
+            return
+        for user, text, css in self._flair_cache.entries():
+            yield {
+                "flair_css_class": css,
+                "flair_text": text,
+                "user": self.reddit.redditor(user),
+            }
+
+    def flair_diff(self):
+        """Display flair changes since the previous snapshot."""
+        header = self.snapshot.header(self.sub.display_name)
+        fresh = self._temporary_snapshot()
+        for _ in self._fetch_flair(fresh):
+            pass
+        if header is None:
+            print("No previous flair snapshot; saved {}".format(self.snapshot.path))
         else:
-            for item in self._current_flair:
-                yield item
+            print(
+                "Flair changes since {}:".format(
+                    datetime.fromtimestamp(header["timestamp"]).strftime(
+                        "%Y-%m-%d %H:%M"
+                    )
+                )
+            )
+            counts = Counter()
+            for user, old, new in FlairSnapshot.diff(
+                self.snapshot.entries(), fresh.entries()
+            ):
+                if old is None:
+                    counts["added"] += 1
+                    print("+ {}\n  Text: {}\n   CSS: {}".format(user, *new))
+                elif new is None:
+                    counts["removed"] += 1
+                    print("- {}".format(user))
+                else:
+                    counts["changed"] += 1
+                    print(
+                        "~ {}\n  Text: {} -> {}\n   CSS: {} -> {}".format(
+                            user, old[0], new[0], old[1], new[1]
+                        )
+                    )
+            print(
+                "{} added, {} removed, {} changed".format(
+                    counts["added"], counts["removed"], counts["changed"]
+                )
+            )
+        self.snapshot.save(self.sub.display_name, fresh.entries(), presorted=True)
+        self._flair_cache = self.snapshot
 
+    @traced
     def flair_template_sync(
         self, editable, limit, static, sort, use_css, use_text  # pylint: disable=R0912
     ):
@@ -125,13 +747,9 @@ class ModUtils(object):
         else:
             items = sorted(counter.items(), key=lambda x: x[1], reverse=True)
 
-        # Clear current templates and store flair according to the sort
-        if self.verbose:
-            print("Clearing current flair templates")
-        self.sub.flair.templates.clear()
+        desired = []
         for key, count in items:
             if not key or count < limit:
-                print("a")
                 continue
             if use_text and use_css:
                 text, css = key
@@ -139,15 +757,53 @@ class ModUtils(object):
                 text, css = key, ""
             else:
                 text, css = "", key
-            if self.verbose:
-                print("Adding template: text: {!r} css: {!r}".format(text, css))
-            self.sub.flair.templates.add(text, css, editable)
+            desired.append((text or "", css or "", bool(editable)))
 
-    def message(self, category, subject, msg_file):
-        """Send message to all users in `category`."""
-        users = getattr(self.sub, category)
-        if not users:
-            print("There are no {} users on {}.".format(category, self.sub))
+        # Apply only the changes needed to reach the desired templates
+        with uncached(self.reddit):
+            existing = list(self.sub.flair.templates)
+        changes = template_changes(existing, desired)
+        if self.verbose:
+            print(
+                "Syncing {} flair templates with {} changes".format(
+                    len(desired), len(changes)
+                )
+            )
+        for action, template_id, template in changes:
+            if self.verbose and template:
+                print(
+                    "{} template: text: {!r} css: {!r}".format(
+                        action.capitalize(), template[0], template[1]
+                    )
+                )
+            elif self.verbose:
+                print("Delete template: {}".format(template_id))
+            if action == "add":
+                self.sub.flair.templates.add(*template)
+            elif action == "delete":
+                self.sub.flair.templates.delete(template_id)
+            else:
+                self.sub.flair.templates.update(template_id, *template)
+
+    @traced
+    def message(
+        self, category, subject, msg_file, journal=None, workers=DEFAULT_WORKERS
+    ):
+        """Send message to all users in `category`.
+
+        :param category: One of 'banned', 'contributor', or 'moderator'.
+        :param subject: The subject of the message.
+        :param msg_file: The file containing the message, or None to read the
+            message from STDIN.
+        :param journal: When provided, the path of a file recording the users
+            that were messaged. Users recorded in it are not messaged again.
+        :param workers: The maximum number of concurrent requests.
+
+        """
+        with uncached(self.reddit):
+            members = list(self._members(category))
+        if not members:
+            print("There are no {} users on {} to message.".format(category, self.sub))
             return
 
         if msg_file:
@@ -160,24 +816,94 @@ class ModUtils(object):
             print("Enter message:")
             msg = sys.stdin.read()
 
+        digest = message_digest(subject, msg)
+        journal = Journal(journal)
+        users = [
+            user
+            for user in members
+            if journal_key("message", category, user, digest) not in journal
+        ]
+        if not users:
+            journal.close()
+            print(
+                "All {} users on {} were already sent this message.".format(
+                    category, self.sub
+                )
+            )
+            return
+
+        if len(users) > 20:
+            recipients = "{}, and {} others".format(
+                ", ".join(str(x) for x in users[:20]), len(users) - 20
+            )
+        else:
+            recipients = ", ".join(str(x) for x in users)
         print(
             "You are about to send the following message to the users {}:".format(
-                ", ".join([str(x) for x in users])
+                recipients
             )
         )
         print("---BEGIN MESSAGE---\n{}\n---END MESSAGE---".format(msg))
         if input("Are you sure? yes/[no]: ").lower() not in ["y", "yes"]:
+            journal.close()
             print("Message sending aborted.")
             return
-        for user in users:
-            user.send_message(subject, msg)
-            print("Sent to: {}".format(user))
 
-    def output_current_flair(self, as_json=False):
-        """Display the current flair for all users in the subreddit."""
-        flair_list = sorted(self.current_flair(), key=lambda x: x["user"].name)
+        def send(user):
+            with tracer.span("message user", user=str(user)) as span:
+                for attempt in range(MESSAGE_ATTEMPTS):
+                    span.set(attempts=attempt + 1)
+                    try:
+                        return user.message(subject, msg)
+                    except APIException as error:
+                        if error.error_type != "RATELIMIT":
+                            raise
+                        delay = ratelimit_delay(error.message)
+                        print("Rate limited; waiting {} seconds".format(delay))
+                        time.sleep(delay)
+                raise Exception("Rate limited {} times".format(MESSAGE_ATTEMPTS))
+
+        progress = Progress(len(users))
+        try:
+            # A message is never resent after an error, as reddit may have
+            # delivered it before the error occurred
+            results = run_concurrently(send, users, workers, self.reddit, attempts=1)
+            for user, _, error in results:
+                progress.update()
+                if error:
+                    print("Failed to send to {}: {} ({})".format(user, error, progress))
+                else:
+                    journal.record(journal_key("message", category, user, digest))
+                    print("Sent to: {} ({})".format(user, progress))
+        finally:
+            journal.close()
+
+    def output_current_flair(self, as_json=False, json_lines=False):
+        """Display the current flair for all users in the subreddit.
+
+        Output is produced incrementally from the flair list cached on disk.
+
+        :param as_json: Output a JSON list.
+        :param json_lines: Output one JSON object per line.
+
+        """
+        flair_list = (
+            {"flair_css_class": css, "flair_text": text, "user": user}
+            for user, text, css in self._cached_flair().entries()
+        )
+        if json_lines:
+            for flair in flair_list:
+                print(json.dumps(flair, sort_keys=True))
+            return
         if as_json:
-            print(json.dumps(flair_list, sort_keys=True, indent=4))
+            separator = "["
+            for flair in flair_list:
+                output = json.dumps(flair, sort_keys=True, indent=4)
+                sys.stdout.write(
+                    "{}\n    {}".format(separator, output.replace("\n", "\n    "))
+                )
+                separator = ","
+            print("[]" if separator == "[" else "\n]")
             return
 
         for flair in flair_list:
@@ -211,9 +937,40 @@ class ModUtils(object):
     def output_list(self, category):
         """Display the list of users in `category`."""
         print("{} users:".format(category))
-        for user in getattr(self.sub, category):
+        for user in self._members(category):
             print("  {}".format(user))
 
+    def output_modlog(self, path, group, days=None, action=None, moderator=None):
+        """Display moderation log statistics from the local index at `path`.
+
+        :param path: The path to the :class:`.ModLogIndex` database.
+        :param group: How to group the entries, see :meth:`.ModLogIndex.report`.
+        :param days: When provided, only include entries from the last `days`
+            days.
+        :param action: When provided, only include entries of this action.
+        :param moderator: When provided, only include entries of this moderator.
+
+        """
+        since = time.time() - days * 86400 if days else None
+        index = ModLogIndex(path)
+        try:
+            rows = index.report(self.sub.display_name, group, since, action, moderator)
+        finally:
+            index.close()
+        print("Moderation log entries by {}".format(group))
+        for key, count in rows:
+            print("{0:6} {1}".format(count, key))
+
+    @traced
+    def update_modlog(self, path):
+        """Store new moderation log entries in the local index at `path`."""
+        index = ModLogIndex(path)
+        try:
+            count = index.ingest(self.sub.display_name, self.sub.mod.log(limit=None))
+        finally:
+            index.close()
+        print("Stored {} new moderation log entries".format(count))
+
 
 def main():
     """Provide the entry point in the the modutils command."""
@@ -223,13 +980,38 @@ def main():
         "add": (
             "Add users to one of the following categories: {}".format(mod_choices_dsp)
         ),
+        "apply": (
+            "Set flair from a CSV (user,text,css) or JSON file, such as the "
+            "output of --flair --json."
+        ),
         "clear": "Remove users who have no flair set.",
         "css": "Ignore the CSS field when synchronizing flair.",
         "edit": "When adding flair templates, mark them as editable.",
         "file": "The file containing contents for --message",
+        "output_dir": (
+            "When operating on many subreddits, write the output for each "
+            "subreddit to DIR/SUBREDDIT.txt."
+        ),
+        "subreddit_file": (
+            "Also operate on the subreddits listed in FILE. Many subreddits "
+            "are processed concurrently (see --workers) over one session."
+        ),
+        "journal": (
+            "Record completed operations in FILE. Rerunning with the same "
+            "FILE resumes an interrupted --add or --message. Messages are "
+            "recorded along with a digest of their subject and body, so a "
+            "different message is sent to everyone again."
+        ),
         "flair": "List flair for the subreddit.",
+        "flair_diff": (
+            "Display the users whose flair was added, removed or changed "
+            "since the previous snapshot. Requires --snapshot."
+        ),
         "flair_stats": "Display the number of users with each flair.",
         "json": "Output the results as json. Applies to --flair",
+        "json_lines": (
+            "Output the results as one json object per line. Applies to --flair"
+        ),
         "limit": (
             "The minimum number of users that must have the specified "
             "flair in order to add as a template. default: %default"
@@ -238,11 +1020,31 @@ def main():
             "List the users in one of the following categories: "
             "{}. May be specified more than once.".format(mod_choices_dsp)
         ),
+        "modlog": "The SQLite database storing the local moderation log index.",
+        "modlog_action": "Only include moderation log entries of ACTION.",
+        "modlog_days": "Only include moderation log entries from the last DAYS days.",
+        "modlog_moderator": "Only include moderation log entries by MODERATOR.",
+        "modlog_report": (
+            "Display the number of moderation log entries in the local index "
+            "grouped by one of: `action`, `moderator`, `day`, `week`, or "
+            "`month`. Does not make any requests."
+        ),
+        "modlog_update": (
+            "Fetch moderation log entries newer than those in the local index "
+            "and store them."
+        ),
         "msg": (
             "Send message to users of one of the following categories: "
             "{}. Message subject provided via --subject, content provided "
             "via --file or STDIN."
         ).format(mod_choices_dsp),
+        "snapshot": (
+            "Store the flair list in FILE and reuse it instead of fetching "
+            "the flair list again while it is fresh."
+        ),
+        "snapshot_ttl": (
+            "The number of seconds a flair snapshot is reused for. " "default: %default"
+        ),
         "sort": (
             "The order to add flair templates. Available options are "
             "`alpha` to add alphabetically, and `size` to first add "
@@ -256,11 +1058,20 @@ def main():
         "subject": "The subject of the message to send for --message.",
         "sync": "Synchronize flair templates with current user flair.",
         "text": "Ignore the text field when synchronizing flair.",
+        "workers": (
+            "The maximum number of concurrent requests for --add and "
+            "--message, or of subreddits processed at once. "
+            "default: %default"
+        ),
     }
 
-    usage = "Usage: %prog [options] SUBREDDIT"
+    usage = "Usage: %prog [options] SUBREDDIT..."
     parser = arg_parser(usage=usage)
     parser.add_option("-a", "--add", help=msg["add"])
+    parser.add_option("", "--journal", metavar="FILE", help=msg["journal"])
+    parser.add_option(
+        "-w", "--workers", type="int", default=DEFAULT_WORKERS, help=msg["workers"]
+    )
     parser.add_option(
         "-l",
         "--list",
@@ -271,14 +1082,54 @@ def main():
         default=[],
     )
     parser.add_option("-c", "--clear-empty", action="store_true", help=msg["clear"])
+    parser.add_option("", "--apply-flair", metavar="FILE", help=msg["apply"])
     parser.add_option("-F", "--file", help=msg["file"])
+    parser.add_option(
+        "", "--subreddit-file", metavar="FILE", help=msg["subreddit_file"]
+    )
+    parser.add_option("", "--output-dir", metavar="DIR", help=msg["output_dir"])
     parser.add_option("-f", "--flair", action="store_true", help=msg["flair"])
     parser.add_option("", "--flair-stats", action="store_true", help=msg["flair_stats"])
+    parser.add_option("", "--flair-diff", action="store_true", help=msg["flair_diff"])
     parser.add_option("-m", "--message", choices=mod_choices, help=msg["msg"])
     parser.add_option("", "--subject", help=msg["subject"])
 
     group = OptionGroup(parser, "Format options")
     group.add_option("-j", "--json", action="store_true", help=msg["json"])
+    group.add_option("", "--json-lines", action="store_true", help=msg["json_lines"])
+    parser.add_option_group(group)
+
+    group = OptionGroup(parser, "Snapshot options")
+    group.add_option("", "--snapshot", metavar="FILE", help=msg["snapshot"])
+    group.add_option(
+        "",
+        "--snapshot-ttl",
+        type="int",
+        default=3600,
+        metavar="SECONDS",
+        help=msg["snapshot_ttl"],
+    )
+    parser.add_option_group(group)
+
+    group = OptionGroup(parser, "Moderation log options")
+    group.add_option("", "--modlog", metavar="DB", help=msg["modlog"])
+    group.add_option(
+        "", "--modlog-update", action="store_true", help=msg["modlog_update"]
+    )
+    group.add_option(
+        "",
+        "--modlog-report",
+        choices=sorted(ModLogIndex.groups),
+        metavar="GROUP",
+        help=msg["modlog_report"],
+    )
+    group.add_option(
+        "", "--modlog-days", type="float", metavar="DAYS", help=msg["modlog_days"]
+    )
+    group.add_option("", "--modlog-action", metavar="ACTION", help=msg["modlog_action"])
+    group.add_option(
+        "", "--modlog-moderator", metavar="MODERATOR", help=msg["modlog_moderator"]
+    )
     parser.add_option_group(group)
 
     group = OptionGroup(parser, "Sync options")
@@ -303,26 +1154,118 @@ def main():
     parser.add_option_group(group)
 
     options, args = parser.parse_args()
-    if len(args) == 0:
+    subreddits = list(args)
+    if options.subreddit_file:
+        try:
+            subreddits.extend(read_subreddit_file(options.subreddit_file))
+        except IOError as error:
+            parser.error(str(error))
+    if len(subreddits) == 0:
         parser.error("Must provide subreddit name.")
     if options.message and not options.subject:
         parser.error("Must provide --subject when providing --message.")
-    subreddit = args[0]
+    if options.flair_diff and not options.snapshot:
+        parser.error("Must provide --snapshot when providing --flair-diff.")
+    if options.workers < 1:
+        parser.error("--workers must be at least 1.")
+    if (options.modlog_update or options.modlog_report) and not options.modlog:
+        parser.error("Must provide --modlog when using the moderation log index.")
+    if len(subreddits) > 1:
+        if options.add or options.message:
+            parser.error("--add and --message support only a single subreddit.")
+        if options.snapshot and "{subreddit}" not in options.snapshot:
+            parser.error("--snapshot must contain {subreddit} for many subreddits.")
 
+    if options.trace:
+        tracer.open(options.trace)
     check_for_updates(options)
 
-    modutils = ModUtils(subreddit, options.site, options.verbose)
+    def modutils_for(subreddit, reddit=None):
+        snapshot = None
+        if options.snapshot:
+            snapshot = FlairSnapshot(
+                options.snapshot.format(subreddit=subreddit), options.snapshot_ttl
+            )
+        return ModUtils(subreddit, options.site, options.verbose, snapshot, reddit)
+
+    reddit = create_reddit(
+        options.site,
+        options.workers,
+        options.timeout,
+        options.cache,
+        options.cache_size,
+    )
+    if len(subreddits) == 1:
+        run_operations(modutils_for(subreddits[0], reddit), options)
+        report_connections(reddit, options.verbose)
+        return
+
+    stdout = ThreadLocalOutput(sys.stdout)
+
+    def run(subreddit):
+        output = io.StringIO()
+        with stdout.redirect(output), tracer.span("subreddit", subreddit=subreddit):
+            run_operations(modutils_for(subreddit, reddit), options)
+        return output.getvalue()
+
+    sys.stdout = stdout
+    try:
+        # Individual requests are already retried. Rerunning a subreddit
+        # would repeat its writes and discard the output of the failed run.
+        results = run_concurrently(run, subreddits, options.workers, attempts=1)
+        for subreddit, output, error in results:
+            if error:
+                output = "Failed: {!r}\n".format(error)
+            if options.output_dir:
+                path = os.path.join(options.output_dir, "{}.txt".format(subreddit))
+                with io.open(path, "w", encoding="utf-8") as fp:
+                    fp.write(output)
+                print("{}: {}".format(subreddit, "failed" if error else path))
+            else:
+                print("==> {} <==\n{}".format(subreddit, output))
+    finally:
+        sys.stdout = stdout.default
+    report_connections(reddit, options.verbose)
+
+
+def report_connections(reddit, verbose):
+    """Output the connection reuse of `reddit` when `verbose` is set."""
+    if verbose:
+        for line in connection_summary(reddit):
+            sys.stderr.write(line + "\n")
+
 
+def read_subreddit_file(path):
+    """Return the subreddit names listed in `path`.
+
+    Names are separated by whitespace; text following a ``#`` is ignored.
+
+    """
+    subreddits = []
+    with open(path) as fp:
+        for line in fp:
+            subreddits.extend(line.split("#", 1)[0].split())
+    return subreddits
+
+
+def run_operations(modutils, options):
+    """Run the operations selected by the command line `options`."""
     if options.add:
-        modutils.add_users(options.add)
+        modutils.add_users(options.add, options.journal, options.workers)
     if options.clear_empty:
         modutils.clear_empty()
+    if options.apply_flair:
+        modutils.apply_flair(options.apply_flair)
     for category in options.list:
         modutils.output_list(category)
     if options.flair:
-        modutils.output_current_flair(as_json=options.json)
+        modutils.output_current_flair(
+            as_json=options.json, json_lines=options.json_lines
+        )
     if options.flair_stats:
         modutils.output_flair_stats()
+    if options.flair_diff:
+        modutils.flair_diff()
     if options.sync:
         modutils.flair_template_sync(
             editable=options.editable,
@@ -332,5 +1275,21 @@ def main():
             use_css=not options.ignore_css,
             use_text=not options.ignore_text,
         )
+    if options.modlog_update:
+        modutils.update_modlog(options.modlog)
+    if options.modlog_report:
+        modutils.output_modlog(
+            options.modlog,
+            options.modlog_report,
+            days=options.modlog_days,
+            action=options.modlog_action,
+            moderator=options.modlog_moderator,
+        )
     if options.message:
-        modutils.message(options.message, options.subject, options.file)
+        modutils.message(
+            options.message,
+            options.subject,
+            options.file,
+            options.journal,
+            options.workers,
+        )
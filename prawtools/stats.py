@@ -4,19 +4,29 @@ from collections import defaultdict
 from datetime import datetime
 from tempfile import mkstemp
 import codecs
-import gc
+import heapq
+import itertools
 import logging
 import os
 import re
 import time
 
 
-from praw import Reddit
+from praw.const import API_PATH
+from praw.models import MoreComments
 from prawcore.exceptions import RequestException
 from six import iteritems, text_type as tt
 
-from .helpers import AGENT, arg_parser, check_for_updates
+from .helpers import (
+    arg_parser,
+    check_for_updates,
+    connection_summary,
+    create_reddit,
+    traced,
+    tracer,
+)
 
+MORECHILDREN_LIMIT = 100  # The maximum number of ids per morechildren request
 SECONDS_IN_A_DAY = 60 * 60 * 24
 RE_WHITESPACE = re.compile(r"\s+")
 TOP_VALUES = {"all", "day", "month", "week", "year"}
@@ -80,6 +90,12 @@ class SubredditStats(object):
         else:
             return tt("/comments/{}/_/{}?context=1").format(item.submission.id, item.id)
 
+    @staticmethod
+    def _push_stub(heap, sequence, submission, count, children):
+        # "continue this thread" stubs have no children and are not expanded
+        if children:
+            heapq.heappush(heap, (-(count or 0), next(sequence), submission, children))
+
     @staticmethod
     def _points(points):
         return "1 point" if points == 1 else "{} points".format(points)
@@ -105,14 +121,28 @@ class SubredditStats(object):
     def _user(user):
         return "_deleted_" if user is None else tt("/u/{}").format(user)
 
-    def __init__(self, subreddit, site, distinguished, output_subreddit, reddit=None):
-        """Initialize the SubredditStats instance with config options."""
+    def __init__(
+        self,
+        subreddit,
+        site,
+        distinguished,
+        output_subreddit,
+        reddit=None,
+        expand_budget=0,
+    ):
+        """Initialize the SubredditStats instance with config options.
+
+        :param expand_budget: The maximum number of requests used to load
+            comments hidden behind "load more comments" (default: 0).
+
+        """
         self.commenters = defaultdict(list)
         self.comments = []
         self.distinguished = distinguished
+        self.expand_budget = expand_budget
         self.min_date = 0
         self.max_date = time.time() - SECONDS_IN_A_DAY
-        self.reddit = reddit or Reddit(site, check_for_updates=False, user_agent=AGENT)
+        self.reddit = reddit or create_reddit(site)
         self.submissions = {}
         self.submitters = defaultdict(list)
         self.submit_subreddit = self.reddit.subreddit(output_subreddit)
@@ -150,6 +180,71 @@ class SubredditStats(object):
             retval += "__{}__|{}|{}\n".format(*quad)
         return retval + "\n"
 
+    @traced
+    def expand_comments(self, stubs):
+        """Load the comments of MoreComments stubs within the request budget.
+
+        Stubs are loaded largest first. The children of a submission's stubs are
+        combined into morechildren requests of up to 100 ids, and stubs
+        returned by those requests are queued in turn.
+
+        :param stubs: A list of (MiniSubmission, count, children) tuples taken
+            from MoreComments stubs. Keeping only these avoids retaining the
+            stubs, which reference their submission's entire comment forest.
+
+        """
+        heap, sequence = [], itertools.count()
+        for submission, count, children in stubs:
+            self._push_stub(heap, sequence, submission, count, children)
+
+        requests = 0
+        while heap and requests < self.expand_budget:
+            _, _, submission, children = heapq.heappop(heap)
+            ids = list(children)
+            same = [x for x in heap if x[2] is submission]
+            for item in sorted(same):
+                if len(ids) >= MORECHILDREN_LIMIT:
+                    break
+                heap.remove(item)
+                ids.extend(item[3])
+            if same:
+                heapq.heapify(heap)
+            if len(ids) > MORECHILDREN_LIMIT:  # Requeue the overflow
+                overflow = ids[MORECHILDREN_LIMIT:]
+                heapq.heappush(
+                    heap, (-len(overflow), next(sequence), submission, overflow)
+                )
+                ids = ids[:MORECHILDREN_LIMIT]
+
+            data = {
+                "children": ",".join(ids),
+                "link_id": "t3_{}".format(submission.id),
+                "sort": "top",
+            }
+            for i in range(3):
+                try:
+                    things = self.reddit.post(API_PATH["morechildren"], data=data)
+                    break
+                except RequestException:
+                    if i >= 2:
+                        raise
+                    logger.debug("Failed to expand {}, retrying".format(submission.id))
+            requests += 1
+
+            for thing in things:
+                if isinstance(thing, MoreComments):
+                    self._push_stub(
+                        heap, sequence, submission, thing.count, thing.children
+                    )
+                elif self.distinguished or thing.distinguished is None:
+                    self.comments.append(MiniComment(thing, submission))
+
+        logger.debug(
+            "Expanded comments with {} requests, {} stubs remain".format(
+                requests, len(heap)
+            )
+        )
+
     def fetch_recent_submissions(self, max_duration):
         """Fetch recent submissions in subreddit with boundaries.
 
@@ -168,6 +263,7 @@ class SubredditStats(object):
                 continue
             self.submissions[submission.id] = MiniSubmission(submission)
 
+    @traced
     def fetch_submissions(self, submissions_callback, *args):
         """Wrap the submissions_callback function."""
         logger.debug("Fetching submissions")
@@ -194,30 +290,41 @@ class SubredditStats(object):
         for submission in self.subreddit.top(limit=None, time_filter=top):
             self.submissions[submission.id] = MiniSubmission(submission)
 
+    @traced
     def process_commenters(self):
         """Group comments by author."""
+        stubs = []
         for index, submission in enumerate(self.submissions.values()):
             if submission.num_comments == 0:
                 continue
-            real_submission = self.reddit.submission(id=submission.id)
-            real_submission.comment_sort = "top"
-
-            for i in range(3):
-                try:
-                    real_submission.comments.replace_more(limit=0)
-                    break
-                except RequestException:
-                    if i >= 2:
-                        raise
-                    logger.debug(
-                        "Failed to fetch submission {}, retrying".format(submission.id)
-                    )
-
-            self.comments.extend(
-                MiniComment(comment, submission)
-                for comment in real_submission.comments.list()
-                if self.distinguished or comment.distinguished is None
-            )
+            with tracer.span("submission", id=submission.id) as span:
+                real_submission = self.reddit.submission(id=submission.id)
+                real_submission.comment_sort = "top"
+
+                for i in range(3):
+                    try:
+                        skipped = real_submission.comments.replace_more(limit=0)
+                        break
+                    except RequestException:
+                        if i >= 2:
+                            raise
+                        logger.debug(
+                            "Failed to fetch submission {}, retrying".format(
+                                submission.id
+                            )
+                        )
+
+                count = len(self.comments)
+                self.comments.extend(
+                    MiniComment(comment, submission)
+                    for comment in real_submission.comments.list()
+                    if self.distinguished or comment.distinguished is None
+                )
+                span.set(attempts=i + 1, comments=len(self.comments) - count)
+            if self.expand_budget:
+                stubs.extend(
+                    (submission, more.count, list(more.children)) for more in skipped
+                )
 
             if index % 50 == 49:
                 logger.debug(
@@ -226,9 +333,8 @@ class SubredditStats(object):
                     )
                 )
 
-            # Clean up to reduce memory usage
-            submission = None
-            gc.collect()
+        if stubs:
+            self.expand_comments(stubs)
 
         self.comments.sort(key=lambda x: x.created_utc)
         for comment in self.comments:
@@ -243,6 +349,7 @@ class SubredditStats(object):
             ):
                 self.submitters[submission.author].append(submission)
 
+    @traced
     def publish_results(self, view, submitters, commenters):
         """Submit the results to the subreddit. Has no return value (None)."""
 
@@ -443,6 +550,18 @@ def main():
         default=10,
         help="Number of top submitters to display " "[default %default]",
     )
+    parser.add_option(
+        "-e",
+        "--expand",
+        type="int",
+        default=0,
+        metavar="REQUESTS",
+        help=(
+            "Use up to REQUESTS additional requests to load comments hidden "
+            "behind 'load more comments' links, largest first "
+            "[default %default]"
+        ),
+    )
     parser.add_option(
         "-o",
         "--output",
@@ -464,9 +583,25 @@ def main():
     if len(args) != 2:
         parser.error("SUBREDDIT and VIEW must be provided")
     subreddit, view = args
+    if options.trace:
+        tracer.open(options.trace)
     check_for_updates(options)
-    srs = SubredditStats(subreddit, options.site, options.distinguished, options.output)
+    srs = SubredditStats(
+        subreddit,
+        options.site,
+        options.distinguished,
+        options.output,
+        reddit=create_reddit(
+            options.site,
+            timeout=options.timeout,
+            cache=options.cache,
+            cache_size=options.cache_size,
+        ),
+        expand_budget=options.expand,
+    )
     result = srs.run(view, options.submitters, options.commenters)
+    for line in connection_summary(srs.reddit):
+        logger.debug(line)
     if result:
         print(result.permalink)
     return 0
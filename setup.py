@@ -47,6 +47,7 @@ setup(
     description="A collection of utilities that utilize the reddit API.",
     entry_points={
         "console_scripts": [
+            "fake_reddit = prawtools.fake:main",
             "modutils = prawtools.mod:main",
             "reddit_alert = prawtools.alert:main",
             "subreddit_stats = prawtools.stats:main",
@@ -0,0 +1,295 @@
+"""Test reddit_alert."""
+
+import json
+import os
+import signal
+import tempfile
+import unittest
+
+import mock
+from prawtools.alert import (
+    Matcher,
+    Metrics,
+    MiniComment,
+    MiniSubmission,
+    Result,
+    Rule,
+    RuleWatcher,
+    _init_worker,
+    _match_worker,
+    item_stream,
+    load_rules,
+    match_items,
+    matcher_pool,
+    quick_url,
+    read_corpus,
+    record_items,
+)
+
+
+def comment(body, author="someone", subreddit="redditdev"):
+    return MiniComment(author, body, 1466000000, "c1", "t3_s1", subreddit)
+
+
+class MatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.matcher = Matcher(["praw", "Reddit API"], ["BBoe"])
+
+    def test_match(self):
+        self.assertEqual("praw", self.matcher.match(comment("I like PRAW.")))
+        self.assertEqual(
+            "reddit api", self.matcher.match(comment("the reddit api is neat"))
+        )
+
+    def test_match__grouped_keywords(self):
+        matcher = Matcher(
+            [Rule("foo(bar)?", ignore_users=["bboe"]), "ba[zr]", "(q)(u+)x"]
+        )
+        self.assertEqual("foobar", matcher.match(comment("a foobar")))
+        self.assertEqual("baz", matcher.match(comment("a baz")))
+        self.assertEqual("quux", matcher.match(comment("a quux")))
+        self.assertEqual("baz", matcher.match(comment("foo baz", author="bboe")))
+
+    def test_match__many_keywords(self):
+        matcher = Matcher(["word{}".format(x) for x in range(20000)] + ["c+"])
+        self.assertEqual("word19999", matcher.match(comment("a WORD19999!")))
+        self.assertEqual("ccc", matcher.match(comment("ccc word")))
+        self.assertIsNone(matcher.match(comment("words wordy")))
+
+    def test_match__grouped_and_plain_keywords(self):
+        matcher = Matcher(
+            ["(q)(u+)x", Rule("foo(bar)?", ignore_users=["bboe"]), "qux", "baz"]
+        )
+        self.assertEqual("quuux", matcher.match(comment("a quuux")))
+        self.assertEqual("foobar", matcher.match(comment("a foobar")))
+        self.assertEqual("qux", matcher.match(comment("a qux")))
+        self.assertEqual("baz", matcher.match(comment("foo baz", author="bboe")))
+        self.assertIsNone(matcher.match(comment("foo", author="bboe")))
+
+    def test_match__ignored_user(self):
+        self.assertIsNone(self.matcher.match(comment("praw", author="bboe")))
+
+    def test_match__overlapping_keywords(self):
+        matcher = Matcher(["praw", "praw api", "pr"])
+        self.assertEqual("praw api", matcher.match(comment("the praw api")))
+        self.assertEqual("praw", matcher.match(comment("the praw apis")))
+        self.assertEqual("pr", matcher.match(comment("a pr")))
+
+    def test_match__partial_word(self):
+        self.assertIsNone(self.matcher.match(comment("prawtools")))
+
+    def test_match_worker(self):
+        handler = signal.getsignal(signal.SIGINT)
+        self.addCleanup(signal.signal, signal.SIGINT, handler)
+        _init_worker(self.matcher)
+        item = comment("praw")
+        result = _match_worker(item)
+        self.assertEqual(("praw", item), result[:2])
+        self.assertEqual(item.created_utc, result.created_utc)
+        self.assertEqual((None, None), _match_worker(comment("nothing"))[:2])
+
+    def test_match__scoped_rules(self):
+        matcher = Matcher(
+            ["praw", Rule("python", ["learnpython"], ["bboe"])], subreddits=["a", "b"]
+        )
+        self.assertEqual("a+b", matcher.subreddit)
+        self.assertIsNone(matcher.match(comment("python")))
+        self.assertEqual(
+            "python", matcher.match(comment("python", subreddit="LearnPython"))
+        )
+        self.assertIsNone(
+            matcher.match(comment("python", author="bboe", subreddit="learnpython"))
+        )
+        self.assertEqual(
+            "praw",
+            matcher.match(
+                comment("python praw", author="bboe", subreddit="learnpython")
+            ),
+        )
+
+
+class MatchItemsTest(unittest.TestCase):
+    def test_match_items(self):
+        matcher = Matcher(["praw"])
+        items = [comment("praw"), comment("nothing")]
+        results = list(match_items(items, lambda: matcher))
+        self.assertEqual([("praw", items[0]), (None, None)], [x[:2] for x in results])
+
+    def test_match_items__pool(self):
+        matcher = Matcher(["praw"])
+        items = [comment("nothing"), comment("praw")] * 5
+        pool = matcher_pool(2, matcher)
+        self.addCleanup(pool.terminate)
+        results = list(match_items(items, lambda: matcher, pool, 2))
+        self.assertEqual([None, "praw"] * 5, [x.keyword for x in results])
+
+    def test_record_items(self):
+        items = [
+            comment("praw"),
+            MiniSubmission("bboe", "title\n\nbody", 1466000000, "s1", "redditdev"),
+        ]
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with open(path, "w") as fp:
+            self.assertEqual(items, list(record_items(items, fp)))
+        self.assertEqual(items, list(read_corpus(path)))
+        self.assertIsInstance(list(read_corpus(path))[1], MiniSubmission)
+
+
+class MetricsTest(unittest.TestCase):
+    def test_render(self):
+        metrics = Metrics()
+        metrics._previous = (100, 0, 0, 0.0)
+        metrics.observe(Result(None, None, 150, 0.25))
+        metrics.observe(Result("praw", comment("praw"), 140, 0.75))
+        metrics.tick(now=102)
+        output = metrics.render(now=160)
+        self.assertIn("# TYPE reddit_alert_comments_total counter\n", output)
+        self.assertIn("reddit_alert_comments_total 2\n", output)
+        self.assertIn("reddit_alert_matches_total 1\n", output)
+        self.assertIn("reddit_alert_comments_per_second 1.0\n", output)
+        self.assertIn("reddit_alert_matches_per_second 0.5\n", output)
+        self.assertIn("reddit_alert_match_seconds_per_comment 0.5\n", output)
+        self.assertIn("reddit_alert_stream_lag_seconds 10\n", output)
+        self.assertIn("reddit_alert_delivery_queue_depth 0\n", output)
+
+
+class RulesTest(unittest.TestCase):
+    def setUp(self):
+        descriptor, self.path = tempfile.mkstemp(".json")
+        os.close(descriptor)
+        self.addCleanup(os.remove, self.path)
+
+    def write(self, data, mtime):
+        with open(self.path, "w") as fp:
+            json.dump(data, fp)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_load_rules(self):
+        self.write(
+            {
+                "ignore_users": ["spez"],
+                "keywords": ["praw", {"keyword": "python", "subreddits": ["a"]}],
+                "subreddits": ["a"],
+            },
+            1,
+        )
+        matcher = load_rules(self.path, ["bboe"], subreddits=["b"])
+        self.assertEqual(["bboe", "praw", "python"], matcher.keywords)
+        self.assertEqual({"spez"}, matcher.ignore_users)
+        self.assertEqual("a+b", matcher.subreddit)
+
+    def test_load_rules__invalid(self):
+        self.write({"keywords": [{"subreddits": ["a"]}]}, 1)
+        self.assertRaises(ValueError, load_rules, self.path)
+        self.write({}, 1)
+        self.assertRaises(ValueError, load_rules, self.path)
+
+    def test_rule_watcher(self):
+        self.write({"keywords": ["praw"]}, 1)
+        loader = lambda: load_rules(self.path)  # noqa: E731
+        watcher = RuleWatcher(self.path, loader, loader())
+        self.assertFalse(watcher.check())
+
+        self.write({"keywords": ["python"]}, 2)
+        self.assertTrue(watcher.check())
+        self.assertEqual(["python"], watcher.matcher.keywords)
+
+        with open(self.path, "w") as fp:
+            fp.write("{")
+        os.utime(self.path, (3, 3))
+        self.assertFalse(watcher.check())
+        self.assertEqual(["python"], watcher.matcher.keywords)
+
+    @mock.patch("sys.stderr")
+    def test_rule_watcher__invalid_regex(self, stderr):
+        self.write({"keywords": ["praw"]}, 1)
+        loader = lambda: load_rules(self.path)  # noqa: E731
+        watcher = RuleWatcher(self.path, loader, loader())
+
+        self.write({"keywords": ["praw", "foo("]}, 2)
+        self.assertFalse(watcher.check())
+        self.assertEqual(["praw"], watcher.matcher.keywords)
+        self.assertIn("'foo('", stderr.write.call_args[0][0])
+
+        self.write({"keywords": ["python"]}, 3)
+        self.assertTrue(watcher.check())
+        self.assertEqual(["python"], watcher.matcher.keywords)
+
+
+class ItemStreamTest(unittest.TestCase):
+    def test_item_stream(self):
+        def thing(fullname, **kwargs):
+            kwargs.setdefault("author", None)
+            return mock.Mock(
+                created_utc=1, fullname=fullname, id=fullname[3:], **kwargs
+            )
+
+        def listing(*items):
+            for item in items:
+                yield item
+
+        stream = mock.Mock()
+        stream.comments.return_value = listing(
+            thing("t1_a", body="one", link_id="t3_x"),
+            None,
+            thing("t1_b", body="two", link_id="t3_x"),
+            None,
+        )
+        stream.submissions.return_value = listing(
+            thing("t3_x", title="title", selftext="text"), None
+        )
+        session = mock.Mock()
+        session.subreddit.return_value.stream = stream
+        matcher = Matcher(["praw"], subreddits=["redditdev"])
+
+        items = item_stream(session, lambda: matcher, submissions=True)
+        self.assertEqual(
+            ["a", "x", "b"],
+            [next(items).id for _ in range(3)],
+        )
+        session.subreddit.assert_called_once_with("redditdev")
+
+    @mock.patch("prawtools.alert.time.sleep")
+    def test_item_stream__backoff(self, mock_sleep):
+        def listing(*items):
+            for item in items:
+                yield item
+
+        first = mock.Mock(
+            author=None, body="one", created_utc=1, fullname="t1_a", link_id="t3_x"
+        )
+        second = mock.Mock(
+            author=None, body="two", created_utc=1, fullname="t1_b", link_id="t3_x"
+        )
+        stream = mock.Mock()
+        stream.comments.return_value = listing(
+            first, None, None, first, None, None, second, None
+        )
+        session = mock.Mock()
+        session.subreddit.return_value.stream = stream
+        matcher = Matcher(["praw"])
+
+        items = item_stream(session, lambda: matcher)
+        self.assertEqual("one", next(items).body)
+        self.assertEqual(0, mock_sleep.call_count)
+        self.assertEqual("two", next(items).body)
+        delays = [call[0][0] for call in mock_sleep.call_args_list]
+        self.assertEqual(3, len(delays))
+        self.assertTrue(delays[0] < delays[1] < delays[2] <= 16.5)
+
+
+class QuickUrlTest(unittest.TestCase):
+    def test_quick_url__submission(self):
+        submission = MiniSubmission(None, "praw", 1, "s1", "redditdev")
+        self.assertEqual(
+            "http://www.reddit.com/r/redditdev/comments/s1/", quick_url(submission)
+        )
+        self.assertEqual("praw", Matcher(["praw"]).match(submission))
+
+    def test_quick_url(self):
+        self.assertEqual(
+            "http://www.reddit.com/r/redditdev/comments/s1/_/c1?context=3",
+            quick_url(comment("praw")),
+        )
@@ -0,0 +1,96 @@
+"""Test the fake reddit API server."""
+
+import threading
+import unittest
+
+from praw import Reddit
+from praw.models import Comment
+from prawtools.fake import FakeReddit, RateLimit, Server
+from prawtools.stats import SubredditStats
+
+
+class FakeRedditTest(unittest.TestCase):
+    def test_stream(self):
+        fake = FakeReddit(stream_rate=10)
+        fake.started -= 5
+        names = [x["data"]["name"] for x in fake.stream("all")["data"]["children"]]
+        self.assertEqual(50, len(names))
+        newer = fake.stream("all", before=names[10])["data"]["children"]
+        self.assertEqual(names[:10], [x["data"]["name"] for x in newer])
+
+    def test_submission_listing(self):
+        fake = FakeReddit(submissions=30, interval=3600)
+        page = fake.submission_listing("test", limit=20)["data"]
+        self.assertEqual(20, page["dist"])
+        page = fake.submission_listing("test", page["after"], 20)["data"]
+        self.assertEqual((10, None), (page["dist"], page["after"]))
+        page = fake.submission_listing("test", window=7200)["data"]
+        self.assertEqual(3, page["dist"])
+
+
+class RateLimitTest(unittest.TestCase):
+    def test_hit(self):
+        rate_limit = RateLimit(2, 60)
+        self.assertEqual(
+            (
+                True,
+                {
+                    "x-ratelimit-remaining": "1.0",
+                    "x-ratelimit-reset": "50",
+                    "x-ratelimit-used": "1",
+                },
+            ),
+            rate_limit.hit(130),
+        )
+        self.assertTrue(rate_limit.hit(131)[0])
+        self.assertFalse(rate_limit.hit(132)[0])
+        self.assertEqual("1", rate_limit.hit(180)[1]["x-ratelimit-used"])
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        fake = FakeReddit(submissions=10, comments=30, visible=10, users=1500)
+        self.server = Server(("127.0.0.1", 0), fake)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.shutdown)
+        url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.reddit = Reddit(
+            check_for_updates=False,
+            client_id="fake",
+            client_secret="fake",
+            oauth_url=url,
+            password="fake",
+            reddit_url=url,
+            short_url=url,
+            user_agent="prawtools tests",
+            username="fake",
+        )
+
+    def test_comments(self):
+        submission = next(self.reddit.subreddit("test").new())
+        comments = submission.comments.list()
+        self.assertEqual(10, sum(isinstance(x, Comment) for x in comments))
+        submission.comments.replace_more(limit=None)
+        self.assertEqual(submission.num_comments, len(submission.comments.list()))
+        self.assertIn("remaining", self.reddit.auth.limits)
+
+    def test_flair(self):
+        subreddit = self.reddit.subreddit("test")
+        subreddit.flair.update([{"user": "user1", "flair_text": "new"}])
+        flair = list(subreddit.flair(limit=None))
+        self.assertEqual(1500, len(flair))
+        self.assertEqual("new", flair[1]["flair_text"])
+
+    def test_subreddit_stats(self):
+        stats = SubredditStats(
+            "test", None, True, "output", reddit=self.reddit, expand_budget=100
+        )
+        stats.fetch_submissions(stats.fetch_top_submissions, "all")
+        self.assertEqual(10, len(stats.submissions))
+        self.assertEqual(
+            sum(x.num_comments for x in stats.submissions.values()),
+            len(stats.comments),
+        )
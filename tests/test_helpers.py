@@ -0,0 +1,283 @@
+"""Test prawtools.helpers."""
+
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import mock
+from prawcore.exceptions import RequestException
+from prawtools.helpers import (
+    Journal,
+    Progress,
+    ThreadLocalOutput,
+    Tracer,
+    TunedSession,
+    chunks,
+    connection_summary,
+    create_reddit,
+    NULL_SPAN,
+    ResponseCache,
+    ratelimit_delay,
+    retry,
+    run_concurrently,
+)
+from six.moves import BaseHTTPServer
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.headers.get("If-None-Match") == "v1":
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.send_header("ETag", "v1")
+        self.send_header("x-ratelimit-used", "1")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def do_POST(self):
+        self.requests.append(self.path)
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+class HelpersTest(unittest.TestCase):
+    def serve(self):
+        del KeepAliveHandler.requests[:]
+        server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.addCleanup(server.server_close)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        return "http://127.0.0.1:{}/".format(server.server_port)
+
+    def temporary_path(self):
+        descriptor, path = tempfile.mkstemp()
+        os.close(descriptor)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_chunks(self):
+        self.assertEqual([[0, 1], [2, 3], [4]], list(chunks(range(5), 2)))
+        self.assertEqual([], list(chunks([], 2)))
+
+    def test_create_reddit(self):
+        reddit = create_reddit(pool_size=8, timeout=5)
+        session = reddit._core._requestor._http
+        self.assertIsInstance(session, TunedSession)
+        self.assertEqual(5, session.timeout)
+        self.assertEqual(
+            8, session.get_adapter("https://oauth.reddit.com")._pool_maxsize
+        )
+        self.assertEqual([], connection_summary(reddit))
+
+    def test_journal(self):
+        descriptor, path = tempfile.mkstemp()
+        os.close(descriptor)
+        self.addCleanup(os.remove, path)
+
+        journal = Journal(path)
+        journal.record("a")
+        journal.record("b")
+        journal.close()
+        with open(path, "a") as fp:
+            fp.write('"c')  # Interrupted while writing
+
+        journal = Journal(path)
+        journal.close()
+        self.assertEqual({"a", "b"}, journal.done)
+        self.assertIn("a", journal)
+        self.assertNotIn("c", journal)
+
+    @mock.patch("time.time", return_value=100)
+    def test_progress(self, _time_mock):
+        progress = Progress(10)
+        self.assertEqual("0/10, 0.00/s, ETA unknown", str(progress))
+        progress.update(4)
+        _time_mock.return_value = 102
+        self.assertEqual("4/10, 2.00/s, ETA 0:00:03", str(progress))
+
+    def test_ratelimit_delay(self):
+        self.assertEqual(
+            301, ratelimit_delay("you are doing that too much. try again in 5 minutes.")
+        )
+        self.assertEqual(11, ratelimit_delay("try again in 10 seconds."))
+        self.assertEqual(60, ratelimit_delay(None))
+
+    def test_response_cache(self):
+        cache = ResponseCache(self.temporary_path(), max_size=12)
+        self.addCleanup(cache.close)
+        self.assertEqual(600, cache.ttl("https://oauth.reddit.com/r/a/api/flairlist/"))
+        self.assertEqual(0, cache.ttl("https://oauth.reddit.com/r/a/about/log/"))
+        self.assertEqual(0, cache.ttl("https://oauth.reddit.com/r/a/new"))
+        self.assertEqual("a?b=1&c=2", cache.key("a", {"c": 2, "b": 1}))
+
+        response = mock.Mock(
+            content=b"abcdef", headers={"ETag": "1", "x-ratelimit-used": "2"}
+        )
+        with mock.patch("time.time", return_value=100):
+            cache.put("a", response)
+            cache.put("b", response)
+        with mock.patch("time.time", return_value=110):
+            cached, fresh = cache.get("a", 20)
+        self.assertEqual(
+            (b"abcdef", {"ETag": "1"}, True),
+            (cached.content, dict(cached.headers), fresh),
+        )
+        with mock.patch("time.time", return_value=130):
+            self.assertFalse(cache.get("a", 20)[1])
+            self.assertEqual((None, False), cache.get("missing", 20))
+            cache.put("c", response)
+        self.assertEqual((None, False), cache.get("b", 20))
+        self.assertEqual((1, 12), (cache.evictions, cache.size))
+
+    @mock.patch("time.sleep", return_value=None)
+    def test_retry(self, _sleep_mock):
+        function = mock.Mock(side_effect=[RequestException(None, None, None), "result"])
+        self.assertEqual("result", retry(function, (1,)))
+        function.side_effect = RequestException(None, None, None)
+        self.assertRaises(RequestException, retry, function, (1,))
+        self.assertEqual(5, function.call_count)
+
+    def test_run_concurrently(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def function(item):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+            if item == 3:
+                raise ValueError(item)
+            return item * 2
+
+        results = sorted(run_concurrently(function, range(10), workers=3))
+        self.assertEqual(3, peak[0])
+        self.assertEqual((0, 0, None), results[0])
+        self.assertIsInstance(results[3][2], ValueError)
+        self.assertEqual((9, 18, None), results[9])
+
+    @mock.patch("time.sleep")
+    def test_run_concurrently__attempts(self, _sleep):
+        function = mock.Mock(side_effect=RequestException(None, None, None))
+        results = list(run_concurrently(function, [1], attempts=1))
+        self.assertIsInstance(results[0][2], RequestException)
+        self.assertEqual(1, function.call_count)
+
+    def test_thread_local_output(self):
+        default, other = io.StringIO(), io.StringIO()
+        output = ThreadLocalOutput(default)
+
+        def write():
+            with output.redirect(other):
+                output.write("other")
+
+        thread = threading.Thread(target=write)
+        with output.redirect(io.StringIO()):
+            thread.start()
+            thread.join()
+        output.write("default")
+        self.assertEqual("default", default.getvalue())
+        self.assertEqual("other", other.getvalue())
+
+    def test_tracer(self):
+        path = self.temporary_path()
+        tracer = Tracer()
+        self.assertIs(NULL_SPAN, tracer.span("disabled"))
+        tracer.open(path)
+        with tracer.span("outer", a=1) as span:
+            span.set(b=2)
+            with self.assertRaises(ValueError):
+                with tracer.span("inner"):
+                    raise ValueError("failed")
+        tracer.complete("complete", 0.5)
+        tracer.close()
+        tracer.complete("ignored", 0.5)
+
+        with open(path) as fp:
+            events = [x for x in json.load(fp) if x.get("ph") == "X"]
+        self.assertEqual(
+            [
+                ("inner", {"error": "ValueError('failed')"}),
+                ("outer", {"a": 1, "b": 2}),
+                ("complete", {}),
+            ],
+            [(x["name"], x["args"]) for x in events],
+        )
+        self.assertLessEqual(events[1]["ts"], events[0]["ts"])
+        self.assertEqual(500000, events[2]["dur"])
+
+    def test_tuned_session(self):
+        url = self.serve()
+        session = TunedSession(pool_size=2, timeout=5)
+        self.addCleanup(session.close)
+        with mock.patch("requests.Session.request") as request:
+            session.get(url, timeout=1)
+            self.assertEqual(5, request.call_args[1]["timeout"])
+        for _ in range(3):
+            self.assertEqual(200, session.get(url).status_code)
+        self.assertEqual([("127.0.0.1", 1, 3)], session.connection_stats())
+
+    def test_tuned_session__cache(self):
+        url = self.serve()
+        cache = ResponseCache(self.temporary_path(), ttls=[(r"^/cached$", 60)])
+        self.addCleanup(cache.close)
+        session = TunedSession(cache=cache)
+        self.addCleanup(session.close)
+        for path in ("cached", "cached", "other", "other", "cached"):
+            self.assertEqual({}, session.get(url + path).json())
+        self.assertEqual(["/cached", "/other", "/other"], KeepAliveHandler.requests)
+        self.assertEqual((2, 1), (cache.hits, cache.misses))
+
+        cache.db.execute("UPDATE response SET stored = 0")
+        self.assertEqual({}, session.get(url + "cached").json())
+        self.assertEqual((1, 1), (cache.revalidations, cache.misses))
+        self.assertTrue(cache.get(url + "cached", 60)[1])
+
+    def test_tuned_session__cache_writes(self):
+        url = self.serve()
+        cache = ResponseCache(self.temporary_path(), ttls=[(r"/about/banned$", 60)])
+        self.addCleanup(cache.close)
+        session = TunedSession(cache=cache)
+        self.addCleanup(session.close)
+        for _ in range(2):
+            for subreddit in "ab":
+                session.get(url + "r/{}/about/banned".format(subreddit))
+        session.post(url + "r/a/api/friend", data={"name": "spez"})
+        for subreddit in "ab":
+            session.get(url + "r/{}/about/banned".format(subreddit))
+        with session.uncached():
+            session.get(url + "r/b/about/banned")
+        self.assertEqual(
+            [
+                "/r/a/about/banned",
+                "/r/b/about/banned",
+                "/r/a/api/friend",
+                "/r/a/about/banned",
+                "/r/b/about/banned",
+            ],
+            KeepAliveHandler.requests,
+        )
+        self.assertEqual(2, len(cache.db.execute("SELECT * FROM response").fetchall()))
+        self.assertEqual(4, cache.size)
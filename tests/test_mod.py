@@ -0,0 +1,424 @@
+"""Test modutils."""
+
+import json
+import os
+import tempfile
+import unittest
+
+import mock
+from praw.exceptions import APIException
+from prawcore.exceptions import RequestException
+from prawtools.fake import FakeReddit, offline_reddit
+from prawtools.helpers import uncached
+from prawtools.mod import (
+    FlairSnapshot,
+    ModLogIndex,
+    ModUtils,
+    external_sort,
+    journal_key,
+    load_flair_file,
+    main,
+    message_digest,
+    read_subreddit_file,
+    template_changes,
+)
+
+
+class ExternalSortTest(unittest.TestCase):
+    def test_external_sort(self):
+        items = [[x % 7, x] for x in range(20)]
+        self.assertEqual(
+            sorted(tuple(x) for x in items),
+            list(external_sort(items, key=lambda x: x[0], chunk_size=3)),
+        )
+
+
+class FlairSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        descriptor, path = tempfile.mkstemp(".jsonl")
+        os.close(descriptor)
+        self.addCleanup(os.remove, path)
+        self.snapshot = FlairSnapshot(path, ttl=60)
+
+    def test_diff(self):
+        old = [("a", "text", "css"), ("b", "", "css"), ("c", "text", "")]
+        new = [("a", "text", "css"), ("c", "other", ""), ("d", "new", "")]
+        self.assertEqual(
+            [
+                ("b", ("", "css"), None),
+                ("c", ("text", ""), ("other", "")),
+                ("d", None, ("new", "")),
+            ],
+            list(FlairSnapshot.diff(old, new)),
+        )
+
+    def test_header__empty(self):
+        self.assertIsNone(self.snapshot.header("redditdev"))
+        self.assertFalse(self.snapshot.is_fresh("redditdev"))
+
+    def test_save(self):
+        self.snapshot.save("redditdev", [("b", "", None), ("a", "text", "css")])
+        self.assertEqual("redditdev", self.snapshot.header("RedditDev")["subreddit"])
+        self.assertTrue(self.snapshot.is_fresh("redditdev"))
+        self.assertFalse(self.snapshot.is_fresh("other"))
+        self.assertEqual(
+            [("a", "text", "css"), ("b", "", None)], list(self.snapshot.entries())
+        )
+        self.snapshot.ttl = -1
+        self.assertFalse(self.snapshot.is_fresh("redditdev"))
+
+
+class LoadFlairFileTest(unittest.TestCase):
+    def load(self, suffix, content):
+        descriptor, path = tempfile.mkstemp(suffix)
+        with os.fdopen(descriptor, "w") as fp:
+            fp.write(content)
+        self.addCleanup(os.remove, path)
+        return load_flair_file(path)
+
+    def test_load_flair_file__csv(self):
+        self.assertEqual(
+            [
+                {"flair_css_class": "css", "flair_text": "a, b", "user": "a"},
+                {"flair_css_class": "", "flair_text": "", "user": "b"},
+            ],
+            self.load(".csv", 'a,"a, b",css\nb\n'),
+        )
+
+    @mock.patch("sys.stdout")
+    def test_load_flair_file__quoted_bulk_flair(self, _stdout):
+        flair = self.load(".csv", 'user1,"say ""hi""",css\nuser2,"a ""b"", c"\n')
+        self.assertEqual('say "hi"', flair[0]["flair_text"])
+        fake = FakeReddit(users=5)
+        modutils = ModUtils("redditdev", reddit=offline_reddit(fake))
+
+        self.assertEqual((2, []), modutils.bulk_flair(flair))
+        self.assertEqual(
+            [('say "hi"', "css"), ('a "b", c', "")],
+            [
+                (x["flair_text"], x["flair_css_class"])
+                for x in fake.flair_list()["users"][1:3]
+            ],
+        )
+
+    def test_load_flair_file__json(self):
+        self.assertEqual(
+            [{"flair_css_class": "", "flair_text": "text", "user": "a"}],
+            self.load(".json", '[{"user": "a", "flair_text": "text"}]'),
+        )
+
+
+class MainTest(unittest.TestCase):
+    @mock.patch("prawtools.mod.check_for_updates")
+    @mock.patch("prawtools.mod.create_reddit")
+    def test_main__many_subreddits(self, reddit, _check):
+        descriptor, path = tempfile.mkstemp()
+        with os.fdopen(descriptor, "w") as fp:
+            fp.write("b  # comment\n\nc\n")
+        self.addCleanup(os.remove, path)
+
+        def subreddit(name):
+            instance = mock.Mock(display_name=name)
+            instance.moderator.return_value = ["mod_" + name]
+            return instance
+
+        reddit.return_value.subreddit.side_effect = subreddit
+        argv = ["modutils", "-l", "moderator", "--subreddit-file", path, "a"]
+        with mock.patch("sys.argv", argv), mock.patch("sys.stdout") as stdout:
+            output = []
+            stdout.write.side_effect = output.append
+            main()
+
+        self.assertEqual(1, reddit.call_count)
+        output = "".join(output)
+        for name in "abc":
+            self.assertIn(
+                "==> {0} <==\nmoderator users:\n  mod_{0}\n".format(name), output
+            )
+
+    @mock.patch("time.sleep")
+    @mock.patch("prawtools.mod.check_for_updates")
+    @mock.patch("prawtools.mod.create_reddit")
+    def test_main__many_subreddits__failure(self, reddit, _check, _sleep):
+        error = RequestException(None, None, None)
+        instances = {}
+
+        def subreddit(name):
+            instance = instances.setdefault(name, mock.Mock(display_name=name))
+            if name == "b":
+                instance.moderator.side_effect = error
+            else:
+                instance.moderator.return_value = ["mod_" + name]
+            return instance
+
+        reddit.return_value.subreddit.side_effect = subreddit
+        argv = ["modutils", "-l", "moderator", "a", "b"]
+        with mock.patch("sys.argv", argv), mock.patch("sys.stdout") as stdout:
+            output = []
+            stdout.write.side_effect = output.append
+            main()
+
+        self.assertEqual(1, instances["b"].moderator.call_count)
+        self.assertIn("==> b <==\nFailed: {!r}\n".format(error), "".join(output))
+
+    def test_read_subreddit_file(self):
+        descriptor, path = tempfile.mkstemp()
+        with os.fdopen(descriptor, "w") as fp:
+            fp.write("a b\n# c\nd # e\n")
+        self.addCleanup(os.remove, path)
+        self.assertEqual(["a", "b", "d"], read_subreddit_file(path))
+
+
+class TemplateChangesTest(unittest.TestCase):
+    @staticmethod
+    def existing(*texts):
+        return [
+            {"css_class": "", "id": text, "text": text, "text_editable": False}
+            for text in texts
+        ]
+
+    @staticmethod
+    def desired(*texts):
+        return [(text, "", False) for text in texts]
+
+    def test_template_changes__append(self):
+        self.assertEqual(
+            [("add", None, ("c", "", False))],
+            template_changes(self.existing("a", "b"), self.desired("a", "b", "c")),
+        )
+
+    def test_template_changes__delete(self):
+        self.assertEqual(
+            [("delete", "b", None), ("delete", "d", None)],
+            template_changes(self.existing("a", "b", "c", "d"), self.desired("a", "c")),
+        )
+
+    def test_template_changes__empty(self):
+        self.assertEqual(
+            [("add", None, ("a", "", False))],
+            template_changes([], self.desired("a")),
+        )
+        self.assertEqual(
+            [("delete", "a", None)], template_changes(self.existing("a"), [])
+        )
+
+    def test_template_changes__insert(self):
+        self.assertEqual(
+            [
+                ("update", "b", ("a", "", False)),
+                ("update", "c", ("b", "", False)),
+                ("add", None, ("c", "", False)),
+            ],
+            template_changes(self.existing("b", "c"), self.desired("a", "b", "c")),
+        )
+
+    def test_template_changes__unchanged(self):
+        self.assertEqual(
+            [], template_changes(self.existing("a", "b"), self.desired("a", "b"))
+        )
+
+    def test_template_changes__update(self):
+        self.assertEqual(
+            [("update", "a", ("a", "", True))],
+            template_changes(
+                self.existing("a", "b"), [("a", "", True), ("b", "", False)]
+            ),
+        )
+
+
+class ModLogIndexTest(unittest.TestCase):
+    def setUp(self):
+        descriptor, path = tempfile.mkstemp(".db")
+        os.close(descriptor)
+        self.addCleanup(os.remove, path)
+        self.index = ModLogIndex(path)
+        self.addCleanup(self.index.close)
+
+    @staticmethod
+    def actions(*entries):
+        return [
+            mock.Mock(
+                action=action,
+                created_utc=created_utc,
+                description=None,
+                details=None,
+                id="ModAction_{}".format(created_utc),
+                mod=mod,
+                target_author="",
+                target_fullname=None,
+            )
+            for created_utc, mod, action in entries
+        ]
+
+    def test_ingest(self):
+        self.assertEqual(
+            2,
+            self.index.ingest(
+                "RedditDev", self.actions((200, "a", "removelink"), (100, "b", "ban"))
+            ),
+        )
+        actions = self.actions(
+            (400, "a", "ban"), (300, "a", "removelink"), (200, "a", "removelink")
+        )
+        actions.append(None)  # Never reached
+        self.assertEqual(2, self.index.ingest("redditdev", actions, batch_size=1))
+        self.assertEqual(0, self.index.ingest("redditdev", []))
+
+        self.assertEqual(
+            [("ban", 2), ("removelink", 2)],
+            self.index.report("redditdev", "action"),
+        )
+        self.assertEqual(
+            [("a", 2)], self.index.report("redditdev", "moderator", since=250)
+        )
+        self.assertEqual(
+            [("1970-01-01", 1)],
+            self.index.report("redditdev", "day", action="ban", moderator="b"),
+        )
+        self.assertEqual([], self.index.report("other", "month"))
+
+
+@mock.patch("prawtools.mod.create_reddit")
+class ModUtilsTest(unittest.TestCase):
+    def setUp(self):
+        self.flair = [
+            {"flair_css_class": "", "flair_text": "", "user": "user{:03}".format(i)}
+            for i in range(250)
+        ] + [{"flair_css_class": "css", "flair_text": "", "user": "keep"}]
+
+    def modutils(self):
+        modutils = ModUtils("redditdev")
+        modutils.sub.display_name = "redditdev"
+        modutils.sub.flair.side_effect = lambda limit: iter(self.flair)
+        return modutils
+
+    def test_clear_empty(self, _reddit):
+        modutils = self.modutils()
+        modutils.sub.flair.update.side_effect = lambda batch: [
+            {"ok": x["user"] != "user000", "status": ""} for x in batch
+        ]
+
+        modutils.clear_empty()
+        self.assertEqual(
+            [100, 100, 50],
+            [len(x[0][0]) for x in modutils.sub.flair.update.call_args_list],
+        )
+        self.assertEqual(
+            ["keep", "user000"], [x[0] for x in modutils._flair_cache.entries()]
+        )
+
+    def test_clear_empty__stale_snapshot(self, _reddit):
+        descriptor, path = tempfile.mkstemp(".jsonl")
+        os.close(descriptor)
+        self.addCleanup(os.remove, path)
+        snapshot = FlairSnapshot(path)
+        snapshot.save("redditdev", [("changed", "", ""), ("empty", "", "")])
+        self.flair = [
+            {"flair_css_class": "", "flair_text": "new", "user": "changed"},
+            {"flair_css_class": "", "flair_text": "", "user": "empty"},
+        ]
+        modutils = self.modutils()
+        modutils.snapshot = snapshot
+        modutils.sub.flair.update.side_effect = lambda batch: [
+            {"ok": True, "status": ""} for _ in batch
+        ]
+
+        modutils.clear_empty()
+        self.assertEqual(
+            ["empty"],
+            [x["user"] for x in modutils.sub.flair.update.call_args[0][0]],
+        )
+        self.assertEqual([("changed", "new", "")], list(snapshot.entries()))
+
+    @mock.patch("sys.stdout")
+    def test_output_current_flair__json(self, stdout, _reddit):
+        self.flair = [self.flair[0], self.flair[-1]]
+        output = []
+        stdout.write.side_effect = output.append
+
+        self.modutils().output_current_flair(as_json=True)
+        self.assertEqual([self.flair[1], self.flair[0]], json.loads("".join(output)))
+
+    @mock.patch("sys.stdin")
+    def test_add_users(self, stdin, _reddit):
+        descriptor, path = tempfile.mkstemp()
+        os.close(descriptor)
+        self.addCleanup(os.remove, path)
+        with open(path, "w") as fp:
+            fp.write('"add/banned/done"\n')
+        stdin.read.return_value = "a, B b\ndone existing c"
+        modutils = self.modutils()
+        modutils.reddit.auth.limits = {}
+        modutils.sub.banned.return_value = ["Existing"]
+
+        with mock.patch("prawtools.mod.uncached", wraps=uncached) as mock_uncached:
+            modutils.add_users("banned", journal=path, workers=2)
+        mock_uncached.assert_called_once_with(modutils.reddit)
+        modutils.sub.banned.assert_called_once_with(limit=None)
+        self.assertEqual(
+            ["B", "a", "c"],
+            sorted(x[0][0] for x in modutils.sub.banned.add.call_args_list),
+        )
+        with open(path) as fp:
+            self.assertEqual(4, len(fp.readlines()))
+
+    @mock.patch("time.sleep", return_value=None)
+    @mock.patch("prawtools.mod.input", return_value="yes")
+    @mock.patch("sys.stdin")
+    def test_message(self, stdin, _input, _sleep, _reddit):
+        descriptor, path = tempfile.mkstemp()
+        os.close(descriptor)
+        self.addCleanup(os.remove, path)
+        digest = message_digest("Subject", "Hello")
+        with open(path, "w") as fp:
+            fp.write('"message/contributor/{}/a"\n'.format(digest))
+            fp.write('"message/contributor/{}/b"\n'.format(message_digest("", "")))
+        stdin.read.return_value = "Hello"
+        users = [mock.Mock(), mock.Mock()]
+        for user, name in zip(users, "ab"):
+            user.__str__ = mock.Mock(return_value=name)
+        users[1].message.side_effect = [
+            APIException("RATELIMIT", "try again in 0 milliseconds", None),
+            None,
+        ]
+        modutils = self.modutils()
+        modutils.reddit.auth.limits = {}
+        modutils.sub.contributor.return_value = users
+
+        modutils.message("contributor", "Subject", None, journal=path)
+        self.assertFalse(users[0].message.called)
+        self.assertEqual(2, users[1].message.call_count)
+        users[1].message.assert_called_with("Subject", "Hello")
+        with open(path) as fp:
+            self.assertEqual(
+                json.dumps(journal_key("message", "contributor", "b", digest)),
+                fp.readlines()[-1].strip(),
+            )
+
+    @mock.patch("prawtools.mod.input", return_value="yes")
+    @mock.patch("sys.stdout")
+    @mock.patch("sys.stdin")
+    def test_message__many_members(self, stdin, _stdout, _input, _reddit):
+        descriptor, path = tempfile.mkstemp()
+        os.close(descriptor)
+        self.addCleanup(os.remove, path)
+        stdin.read.return_value = "Hello"
+        reddit = offline_reddit(FakeReddit(users=2500))
+        modutils = ModUtils("redditdev", reddit=reddit)
+
+        modutils.message("contributor", "Subject", None, journal=path, workers=4)
+        with open(path) as fp:
+            self.assertEqual(250, len(fp.readlines()))
+
+    @mock.patch("prawtools.mod.input", return_value="yes")
+    @mock.patch("sys.stdin")
+    def test_message__no_resend(self, stdin, _input, _reddit):
+        stdin.read.return_value = "Hello"
+        user = mock.Mock()
+        user.message.side_effect = RequestException(None, None, None)
+        modutils = self.modutils()
+        modutils.reddit.auth.limits = {}
+        modutils.sub.contributor.return_value = [user]
+
+        modutils.message("contributor", "Subject", None)
+        self.assertEqual(1, user.message.call_count)
@@ -1,6 +1,13 @@
 """Test subreddit_stats."""
+
+import gc
+import tracemalloc
+import unittest
+
 import mock
-from prawtools.stats import SubredditStats
+from praw.models import MoreComments
+from prawtools.fake import FakeReddit, offline_reddit
+from prawtools.stats import MiniComment, MiniSubmission, SubredditStats
 
 from . import IntegrationTest
 
@@ -22,3 +29,121 @@ class StatsTest(IntegrationTest):
         with self.recorder.use_cassette("StatsTest.top"):
             self.srs.fetch_top_submissions("week")
             self.assertTrue(len(self.srs.submissions) > 1)
+
+
+class ExpandCommentsTest(unittest.TestCase):
+    @staticmethod
+    def comment(comment_id):
+        return mock.Mock(
+            author=None, created_utc=1, distinguished=None, id=comment_id, score=1
+        )
+
+    def test_expand_comments(self):
+        reddit = mock.Mock()
+        srs = SubredditStats("redditdev", None, None, "output", reddit=reddit)
+        srs.expand_budget = 2
+        big, small = mock.Mock(id="big"), mock.Mock(id="small")
+        stubs = [
+            (small, 1, ["s1"]),
+            (big, 80, ["b1", "b2"]),
+            (big, 5, ["b3"]),
+            (big, 0, []),
+        ]
+        reddit.post.side_effect = [
+            [
+                self.comment("b1"),
+                MoreComments(reddit, {"children": ["b4"], "count": 3}),
+            ],
+            [self.comment("b4")],
+        ]
+
+        srs.expand_comments(stubs)
+        self.assertEqual(2, reddit.post.call_count)
+        self.assertEqual(
+            {"children": "b1,b2,b3", "link_id": "t3_big", "sort": "top"},
+            reddit.post.call_args_list[0][1]["data"],
+        )
+        self.assertEqual("b4", reddit.post.call_args_list[1][1]["data"]["children"])
+        self.assertEqual(["b1", "b4"], [x.id for x in srs.comments])
+
+
+class MemoryFootprintTest(unittest.TestCase):
+    # Limits in bytes, about 25% above the measured values
+    MAX_COMMENT_BYTES = 100
+    MAX_PEAK_BYTES_PER_COMMENT = 1000
+    MAX_SUBMISSION_BYTES = 140
+
+    def setUp(self):
+        self.submission = mock.Mock(
+            author="author",
+            created_utc=1.0,
+            distinguished=None,
+            id="id",
+            num_comments=1,
+            permalink="/r/test/comments/id/",
+            score=1,
+            title="title",
+            url="https://www.reddit.com/r/test/comments/id/",
+        )
+
+    @staticmethod
+    def bytes_per_object(factory, count=1000):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [factory() for _ in range(count)]
+        allocated = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del objects
+        return allocated / float(count)
+
+    def test_mini_comment(self):
+        comment = mock.Mock(author="author", created_utc=1.0, id="id", score=1)
+        self.assertLess(
+            self.bytes_per_object(lambda: MiniComment(comment, self.submission)),
+            self.MAX_COMMENT_BYTES,
+        )
+
+    def test_mini_submission(self):
+        self.assertLess(
+            self.bytes_per_object(lambda: MiniSubmission(self.submission)),
+            self.MAX_SUBMISSION_BYTES,
+        )
+
+    def test_process_commenters(self):
+        fake = FakeReddit(submissions=20, comments=100, visible=10000, interval=60)
+        srs = SubredditStats("test", None, True, "output", reddit=offline_reddit(fake))
+        srs.fetch_top_submissions("all")
+        gc.collect()
+        tracemalloc.start()
+        srs.process_commenters()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertEqual(
+            sum(x.num_comments for x in srs.submissions.values()), len(srs.comments)
+        )
+        self.assertLess(
+            peak / float(len(srs.comments)), self.MAX_PEAK_BYTES_PER_COMMENT
+        )
+
+    def test_process_commenters__expand(self):
+        fake = FakeReddit(submissions=20, comments=100, visible=20, interval=60)
+        srs = SubredditStats("test", None, True, "output", reddit=offline_reddit(fake))
+        srs.fetch_top_submissions("all")
+        srs.expand_budget = 1
+        held = []
+        expand_comments = srs.expand_comments
+
+        def measure(stubs):
+            gc.collect()
+            held.append(tracemalloc.get_traced_memory()[0])
+            expand_comments(stubs)
+
+        srs.expand_comments = measure
+        gc.collect()
+        tracemalloc.start()
+        srs.process_commenters()
+        tracemalloc.stop()
+        # The stubs must not keep each submission's comment forest alive
+        self.assertLess(
+            held[0] / float(len(srs.comments)), self.MAX_PEAK_BYTES_PER_COMMENT
+        )